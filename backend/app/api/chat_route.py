@@ -1,50 +1,172 @@
-from fastapi import APIRouter, HTTPException, Body
-from typing import List
+from fastapi import APIRouter, HTTPException, Body, Request
+from typing import List, Optional
 from bson import ObjectId
+from bson.errors import InvalidId
+from datetime import datetime
+import base64
 
+from app.config import Config
 from app.core.database import db
-from app.schemas.chat_schema import ChatSchema
+from app.schemas.chat_schema import ChatSchema, ChatHistoryPageSchema, MessagePageSchema
+from app.crud.chat_messages import read_messages, attach_all_messages, delete_chat_messages
 from app.crud.media_cleanup import delete_media_for_chat_id, clear_media_for_user
-from app.utils.logger import logger
+from app.crud.response_cache import response_cache, user_tag, chat_tag
+from app.utils import fast_json
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
 
 router = APIRouter()
 
+# Responses are rendered straight from the Mongo documents to JSON bytes, cut down to the
+# fields of the declared response_model, which still documents them in the OpenAPI schema.
+# The documents come from our own writes, so they are not validated again.
+CHAT_SHAPE = fast_json.Shape(ChatSchema)
+HISTORY_PAGE_SHAPE = fast_json.Shape(ChatHistoryPageSchema)
+MESSAGE_PAGE_SHAPE = fast_json.Shape(MessagePageSchema)
+
 @router.get("/history", response_model=List[ChatSchema])
-async def get_chat_history(email: str):
+async def get_chat_history(request: Request, email: str):
+    """
+        Get all chat history of user and sort them by newest first, every chat with all of its messages.
+        Cached per user, a matching If-None-Match gets a 304.
+    """
+
+    async def render() -> bytes:
+        chats = await db["chats"].find({"user_email": email}).sort("created_at", -1).to_list(length=None)
+        await attach_all_messages(chats)
+
+        logger.info(f"Fetched chat history for user: {email}, total chats: {len(chats)}")
+        return fast_json.dumps(CHAT_SHAPE, chats, many=True)
+
+    return await response_cache.serve(request, ("history", email), (user_tag(email),), render)
+
+def encode_history_cursor(created_at: datetime, chat_id: ObjectId) -> str:
     """
-        Get all chat history of user and sort them by newest first.
+        Encodes the (created_at, _id) position of the last chat on a page.
     """
 
-    chats = await db["chats"].find({"user_email": email}).sort("created_at", -1).to_list(length=None)
+    raw = f"{created_at.isoformat()}|{chat_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_history_cursor(cursor: str) -> tuple:
+    try:
+        created_at, chat_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), ObjectId(chat_id)
+
+    except (ValueError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.get("/history/page", response_model=ChatHistoryPageSchema)
+async def get_chat_history_page(request: Request, email: str, cursor: Optional[str] = None, limit: Optional[int] = None):
+    """
+        Get one page of the chat history of user, newest first.
+        Only the sidebar fields are returned, the messages are loaded through /api/chat/{chat_id}.
+    """
+
+    return await response_cache.serve(
+        request,
+        ("history_page", email, cursor, limit),
+        (user_tag(email),),
+        lambda: render_history_page(email, cursor, limit)
+    )
+
+async def render_history_page(email: str, cursor: Optional[str], limit: Optional[int]) -> bytes:
+    limit = max(1, min(limit or Config.HISTORY_PAGE_SIZE, Config.HISTORY_MAX_PAGE_SIZE))
+    query = {"user_email": email}
+
+    if cursor:
+        created_at, chat_id = decode_history_cursor(cursor)
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": chat_id}}
+        ]
+
+    # Fetch one extra chat to know whether another page exists
+    chats = await db["chats"].find(
+        query,
+        {"title": 1, "created_at": 1, "last_label": 1, "messages": {"$slice": -1}}
+    ).sort([("created_at", -1), ("_id", -1)]).limit(limit + 1).to_list(length=limit + 1)
+
+    has_more = len(chats) > limit
+    chats = chats[:limit]
+
+    summaries = []
 
-    # Convert ObjectId to string pydantic
     for chat in chats:
-        chat["_id"] = str(chat["_id"])
-    
-    logger.info(f"Fetched chat history for user: {email}, total chats: {len(chats)}")
-    return chats
+        last_message = chat.get("messages") or [{}]
+
+        summaries.append({
+            "_id": str(chat["_id"]),
+            "title": chat["title"],
+            "created_at": chat["created_at"],
+            "last_label": chat.get("last_label") or last_message[-1].get("label")
+        })
+
+    next_cursor = encode_history_cursor(chats[-1]["created_at"], chats[-1]["_id"]) if has_more else None
+
+    logger.info(f"Fetched chat history page for user: {email}, chats: {len(summaries)}")
+    return fast_json.dumps(HISTORY_PAGE_SHAPE, {"chats": summaries, "next_cursor": next_cursor})
 
 @router.get("/{chat_id}", response_model=ChatSchema)
-async def get_chat_details(chat_id: str):
+async def get_chat_details(request: Request, chat_id: str):
     """
-        Get a specific chat by chat_id
+        Get a specific chat by chat_id.
+        Chats stored in the messages collection come with their newest page of messages,
+        older ones are loaded through /api/chat/{chat_id}/messages with `next_cursor`.
+        Cached per chat, a matching If-None-Match gets a 304.
     """
 
+    return await response_cache.serve(request, ("chat", chat_id), (chat_tag(chat_id),), lambda: render_chat_details(chat_id))
+
+async def render_chat_details(chat_id: str) -> Optional[bytes]:
     try:
         chat = await db["chats"].find_one({"_id": ObjectId(chat_id)})
 
         if not chat:
             logger.warning(f"Chat with chat_id: {chat_id} not found")
             return None
-        
-        chat["_id"] = str(chat["_id"])
+
+        chat["messages"], next_key = await read_messages(chat)
+        chat["next_cursor"] = encode_history_cursor(*next_key) if next_key else None
         logger.info(f"Fetched chat details for chat_id: {chat_id}")
-        return chat
-    
+        return fast_json.dumps(CHAT_SHAPE, chat)
+
     except Exception:
         logger.error(f"Failed to get chat details for chat_id: {chat_id}")
         raise HTTPException(status_code=400, detail="Failed to get chat details")
 
+@router.get("/{chat_id}/messages", response_model=MessagePageSchema)
+async def get_chat_messages(request: Request, chat_id: str, cursor: Optional[str] = None, limit: Optional[int] = None):
+    """
+        Get one page of the messages of a chat, oldest first within the page.
+        Pages go back in time: pass `next_cursor` as `cursor` to get the older messages.
+    """
+
+    return await response_cache.serve(
+        request,
+        ("messages", chat_id, cursor, limit),
+        (chat_tag(chat_id),),
+        lambda: render_chat_messages(chat_id, cursor, limit)
+    )
+
+async def render_chat_messages(chat_id: str, cursor: Optional[str], limit: Optional[int]) -> bytes:
+    try:
+        chat_object_id = ObjectId(chat_id)
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="Invalid chat_id")
+
+    chat = await db["chats"].find_one({"_id": chat_object_id}, {"messages": 1, "message_count": 1})
+
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat not found")
+
+    before = decode_history_cursor(cursor) if cursor else None
+    messages, next_key = await read_messages(chat, before, limit)
+
+    logger.info(f"Fetched {len(messages)} messages for chat_id: {chat_id}")
+    return fast_json.dumps(MESSAGE_PAGE_SHAPE, {"messages": messages, "next_cursor": encode_history_cursor(*next_key) if next_key else None})
+
 @router.delete("/delete", response_model=dict)
 async def delete_chat(
     email: str,
@@ -55,8 +177,10 @@ async def delete_chat(
     """
 
     try:
-        await delete_media_for_chat_id(chatId)
+        await delete_media_for_chat_id(chatId, email)
+        await delete_chat_messages({"_id": ObjectId(chatId), "user_email": email})
         result = await db["chats"].delete_one({"_id": ObjectId(chatId), "user_email": email})
+        await response_cache.invalidate(user_tag(email), chat_tag(chatId))
 
         if result.deleted_count == 0:
             logger.error(f"Chat with chat_id: {chatId} for user: {email} not found")
@@ -77,7 +201,9 @@ async def delete_all_chats(email: str):
 
     try:
         await clear_media_for_user(email)
+        chat_ids = await delete_chat_messages({"user_email": email})
         result = await db["chats"].delete_many({"user_email": email})
+        await response_cache.invalidate(user_tag(email), *[chat_tag(chat_id) for chat_id in chat_ids])
 
         if result.deleted_count == 0:
             logger.error(f"No chats found for user: {email} to delete")
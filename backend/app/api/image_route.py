@@ -1,114 +1,58 @@
 from fastapi import APIRouter, UploadFile, Form, File, HTTPException
-from typing import Annotated, Optional
-import tempfile
-import os
-from bson import ObjectId
-from datetime import datetime
-import uuid
-import shutil
-import gc
+from typing import Annotated, List, Optional
 
-from app.core.cloudinary_client import upload_image
-from app.core.database import db
-from app.utils.llm_analysis import analyze_image_with_llm
-from app.utils.logger import logger
+from app.config import Config
+from app.core.pipeline import AnalysisContext, BatchContext, image_pipeline, image_batch_pipeline
 
 router = APIRouter()
 
-MAX_FILE_SIZE = 50 * 1024 * 1024  # 50 MB
-
 @router.post("/analyze")
 async def analyze_image(
     clerk_user_id: Annotated[str, Form()],
     email: Annotated[str, Form()], 
     mime_type: Annotated[str, Form()],
     chat_id: Annotated[Optional[str], Form()] = None,
+    reanalyze: Annotated[bool, Form()] = False,
     file: UploadFile = File(...)
 ):
     """
         Endpoint to upload and analyze the given image.
+        With `reanalyze` media analyzed before gets a new verdict instead of the cached one.
     """
-    if file.size and file.size > MAX_FILE_SIZE:
-        raise HTTPException(status_code=413, detail="File size exceeds the 50MB limit.")
-
-    try:
-        # Save the uploaded file to a temporary location
-        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-            shutil.copyfileobj(file.file, temp_file)
-            temp_file_path = temp_file.name
-
-        if os.path.getsize(temp_file_path) > MAX_FILE_SIZE:
-             os.remove(temp_file_path)
-             raise HTTPException(status_code=413, detail="File size exceeds the 50MB limit.")
-
-        # Free up memory
-        del file
-        gc.collect()
-
-        # Upload image to Cloudinary
-        document_url = upload_image(temp_file_path)
-        logger.info(f"Image uploaded to Cloudinary: {document_url}")
-        gc.collect() 
-
-        # Get the (label, confidence, reason) from LLM
-        label, confidence, reason = analyze_image_with_llm(temp_file_path, mime_type)
-        gc.collect()
-
-        user_msg_id = str(uuid.uuid4())
-        ai_msg_id = str(uuid.uuid4())
 
-        user_message = {
-            "id": user_msg_id,
-            "role": "user",
-            "type": "image",
-            "content": document_url,
-            "created_at": datetime.now()
-        }
+    context = AnalysisContext(
+        clerk_user_id=clerk_user_id,
+        email=email,
+        mime_type=mime_type,
+        chat_id=chat_id,
+        file=file,
+        reanalyze=reanalyze
+    )
 
-        ai_message = {
-            "id": ai_msg_id,
-            "role": "aidentify",
-            "type": "image",
-            "content": document_url,
-            "label": label,
-            "confidence": confidence,
-            "reason": reason,
-            "created_at": datetime.now()
-        }
+    return await image_pipeline.handle(context)
 
-        if not chat_id or chat_id == "null" or chat_id == "":
-            new_chat = {
-                "clerk_user_id": clerk_user_id,
-                "user_email": email,
-                "title": f"Image Analysis {datetime.now().strftime('%H:%M')}",
-                "created_at": datetime.now(),
-                "messages": [user_message, ai_message]
-            }
-
-            result = await db["chats"].insert_one(new_chat)
-            chat_id = str(result.inserted_id)
-        else:
-            result = await db["chats"].update_one(
-                {"_id": ObjectId(chat_id)},
-                {"$push": {"messages": {"$each": [user_message, ai_message]}}}
-            )
+@router.post("/analyze_batch")
+async def analyze_image_batch(
+    clerk_user_id: Annotated[str, Form()],
+    email: Annotated[str, Form()],
+    chat_id: Annotated[Optional[str], Form()] = None,
+    files: List[UploadFile] = File(...)
+):
+    """
+        Endpoint to upload and analyze many images at once.
+        Images are classified in groups with a single LLM request per group,
+        and all messages are saved to one chat with a single write.
+    """
 
-        logger.info(f"Analysis result: {result}")
+    if len(files) > Config.BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {Config.BATCH_MAX_FILES} images can be analyzed at once.")
 
-        return {
-            "chat_id": chat_id,
-            "user_message": user_message,
-            "ai_message": ai_message
-        }
+    context = BatchContext(
+        clerk_user_id=clerk_user_id,
+        email=email,
+        mime_type="image/jpeg",
+        chat_id=chat_id,
+        files=files
+    )
 
-    except HTTPException as he:
-        raise he
-    except Exception as e:
-        logger.error(f"Error in uploading or analyzing image: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
-    
-    finally:
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
-            logger.info(f"Temporary file {temp_file_path} deleted.")
-        gc.collect()
\ No newline at end of file
+    return await image_batch_pipeline.handle(context)
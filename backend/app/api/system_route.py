@@ -0,0 +1,53 @@
+from fastapi import APIRouter
+
+from app.core.video_jobs import video_jobs
+from app.crud.account_deletion import deletion_queue
+from app.crud.response_cache import response_cache
+from app.utils.gemini_files import file_registry
+from app.utils.memory import memory_manager
+from app.utils.preprocess import preprocessor
+
+router = APIRouter()
+
+@router.get("/memory", response_model=dict)
+async def get_memory_stats():
+    """
+        Get RSS, per-request allocation and garbage collection statistics of this worker.
+    """
+
+    return memory_manager.stats()
+
+@router.get("/queues", response_model=dict)
+async def get_queue_stats():
+    """
+        Get depth and lag of the background queues.
+    """
+
+    return {
+        "deletion_jobs": await deletion_queue.stats(),
+        "video_jobs": {"depth": video_jobs.queue.qsize()}
+    }
+
+@router.get("/preprocess", response_model=dict)
+async def get_preprocess_stats():
+    """
+        Get how many files were re-encoded before analysis and the bytes saved.
+    """
+
+    return preprocessor.stats()
+
+@router.get("/response_cache", response_model=dict)
+async def get_response_cache_stats():
+    """
+        Get the entries and bytes held by the response cache of this worker.
+    """
+
+    return response_cache.stats()
+
+@router.get("/gemini_files", response_model=dict)
+async def get_gemini_file_stats():
+    """
+        Get how many files this worker keeps on Gemini for reuse.
+    """
+
+    return file_registry.stats()
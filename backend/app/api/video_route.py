@@ -1,21 +1,19 @@
 from fastapi import APIRouter, UploadFile, Form, File, HTTPException
+from fastapi.responses import StreamingResponse
 from typing import Annotated, Optional
-import tempfile
-import os
-from bson import ObjectId
-from datetime import datetime
-import uuid
-import shutil
-import gc
-
-from app.core.cloudinary_client import upload_video
-from app.core.database import db
-from app.utils.llm_analysis import analyze_video_with_llm
-from app.utils.logger import logger
+import asyncio
 
-router = APIRouter()
+from app.core.admission import admission
+from app.core.pipeline import AnalysisContext, MAX_FILE_SIZE, video_pipeline
+from app.core.video_jobs import video_jobs
+from app.utils.ingest import ingest_upload
+from app.utils.logger import get_logger
+from app.schemas.job_schema import VideoJobSchema, VideoJobSubmitted
+from app.utils.temp_files import remove_temp_file
+
+logger = get_logger(__name__)
 
-MAX_FILE_SIZE = 50 * 1024 * 1024  # 50 MB
+router = APIRouter()
 
 @router.post("/analyze")
 async def analyze_video(
@@ -23,93 +21,101 @@ async def analyze_video(
     email: Annotated[str, Form()], 
     mime_type: Annotated[str, Form()],
     chat_id: Annotated[Optional[str], Form()] = None,
+    reanalyze: Annotated[bool, Form()] = False,
     file: UploadFile = File(...)
 ):
     """
         Endpoint to upload and analyze the given video.
+        With `reanalyze` media analyzed before gets a new verdict instead of the cached one.
+    """
+
+    context = AnalysisContext(
+        clerk_user_id=clerk_user_id,
+        email=email,
+        mime_type=mime_type,
+        chat_id=chat_id,
+        file=file,
+        reanalyze=reanalyze
+    )
+
+    return await video_pipeline.handle(context)
+
+@router.post("/jobs", status_code=202, response_model=VideoJobSubmitted)
+async def submit_video_job(
+    clerk_user_id: Annotated[str, Form()],
+    email: Annotated[str, Form()],
+    mime_type: Annotated[str, Form()],
+    chat_id: Annotated[Optional[str], Form()] = None,
+    file: UploadFile = File(...)
+):
     """
-    
-    if file.size and file.size > MAX_FILE_SIZE:
-        raise HTTPException(status_code=413, detail="File size exceeds the 50MB limit.")
+        Endpoint to queue the given video for analysis in the background.
+        Returns a job id right away, progress is available from the status and events endpoints.
+    """
+
+    temp_file_path = None
+    charged = False
+
+    async def discard():
+        if temp_file_path:
+            remove_temp_file(temp_file_path)
+
+        if charged:
+            await admission.refund(clerk_user_id, "video")
 
     try:
-        # Save the uploaded file to a temporary location
-        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-            shutil.copyfileobj(file.file, temp_file)
-            temp_file_path = temp_file.name
-        
-        if os.path.getsize(temp_file_path) > MAX_FILE_SIZE:
-             os.remove(temp_file_path)
-             raise HTTPException(status_code=413, detail="File size exceeds the 50MB limit.")
-        
-        # Free up memory
-        del file
-        gc.collect()
-        
-        # Upload video to Cloudinary
-        document_url = upload_video(temp_file_path)
-        logger.info(f"Video uploaded to Cloudinary: {document_url}")
-        gc.collect()
-
-        # Get the (label, confidence, reason) from LLM
-        label, confidence, reason = analyze_video_with_llm(temp_file_path, mime_type)
-        gc.collect()
-
-        user_msg_id = str(uuid.uuid4())
-        ai_msg_id = str(uuid.uuid4())
-
-        user_message = {
-            "id": user_msg_id,
-            "role": "user",
-            "type": "video",
-            "content": document_url,
-            "created_at": datetime.now()
-        }
-
-        ai_message = {
-            "id": ai_msg_id,
-            "role": "aidentify",
-            "type": "video",
-            "content": document_url,
-            "label": label,
-            "confidence": confidence,
-            "reason": reason,
-            "created_at": datetime.now()
-        }
-
-        if not chat_id or chat_id == "null" or chat_id == "":
-            new_chat = {
-                "clerk_user_id": clerk_user_id,
-                "user_email": email,
-                "title": f"Video Analysis {datetime.now().strftime('%H:%M')}",
-                "created_at": datetime.now(),
-                "messages": [user_message, ai_message]
-            }
-
-            result = await db["chats"].insert_one(new_chat)
-            chat_id = str(result.inserted_id)
-        else:
-            result = await db["chats"].update_one(
-                {"_id": ObjectId(chat_id)},
-                {"$push": {"messages": {"$each": [user_message, ai_message]}}}
-            )
-
-        logger.info(f"Analysis result: {result}")
-
-        return {
-            "chat_id": chat_id,
-            "user_message": user_message,
-            "ai_message": ai_message
-        }
-    
+        # Stream the upload to a temporary file, hashing and sniffing it on the way
+        ingested = await ingest_upload(file, "video", MAX_FILE_SIZE)
+        temp_file_path = ingested.path
+
+        if video_jobs.queue.full():
+            raise asyncio.QueueFull()
+
+        # Jobs are charged like direct analyses, they only skip the wait for an analysis slot.
+        # Only a valid upload is charged, and the tokens are given back if it cannot be queued.
+        await admission.charge(clerk_user_id, "video")
+        charged = True
+
+        job_id = await video_jobs.submit(temp_file_path, ingested.content_hash, mime_type, clerk_user_id, email, chat_id)
+
+    except asyncio.QueueFull:
+        await discard()
+        raise HTTPException(status_code=503, detail="Too many videos are waiting for analysis, try again later.")
     except HTTPException as he:
+        await discard()
         raise he
     except Exception as e:
-        logger.error(f"Error in uploading or analyzing video: {str(e)}")
+        await discard()
+        logger.error(f"Error in queueing video job: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
-    
-    finally:
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
-            logger.info(f"Temporary file {temp_file_path} deleted.")
-        gc.collect()
\ No newline at end of file
+
+    return {
+        "job_id": job_id,
+        "status_url": f"/api/video/jobs/{job_id}",
+        "events_url": f"/api/video/jobs/{job_id}/events"
+    }
+
+@router.get("/jobs/{job_id}", response_model=VideoJobSchema)
+async def get_video_job(job_id: str):
+    """
+        Get the current status of a video analysis job.
+    """
+
+    job = await video_jobs.get(job_id)
+
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return job
+
+@router.get("/jobs/{job_id}/events")
+async def stream_video_job_events(job_id: str):
+    """
+        Stream the stage transitions of a video analysis job as server-sent events.
+    """
+
+    return StreamingResponse(
+        video_jobs.events(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,13 +1,21 @@
-from fastapi import APIRouter, Request, HTTPException, Header
-from svix.webhooks import Webhook, WebhookVerificationError
+from fastapi import APIRouter, Request, Header
 
-from app.config import Config
-from app.core.database import db
-from app.crud.media_cleanup import delete_media_for_chat_id
-from app.utils.logger import logger
+from app.core.webhooks import clerk_webhooks
+from app.crud.account_deletion import deletion_queue
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
 
 router = APIRouter()
 
+@clerk_webhooks.on("user.deleted")
+async def on_user_deleted(message_id: str, event: dict):
+    user_id = event["data"]["id"]
+
+    # Media and chats are deleted in the background, the svix-id makes webhook retries a no-op
+    if await deletion_queue.enqueue(message_id, event["type"], { "clerk_user_id": user_id }):
+        logger.info(f"Queued data deletion for Clerk user ID: {user_id}")
+
 @router.post("/clerk")
 async def clerk_webhook(
     request: Request,
@@ -18,6 +26,8 @@ async def clerk_webhook(
     """
         This endpoint handles Clerk webhooks when a user deletes their account.
         So that we can delete all media associated and chats with that user.
+        The deletion is queued and the webhook is acknowledged right away,
+        other event types (sessions, profile updates) are acknowledged without any work.
     """
 
     headers = {
@@ -28,27 +38,4 @@ async def clerk_webhook(
 
     payload = await request.body()
 
-    try:
-        webhook = Webhook(Config.CLERK_WEBHOOK_SECRET)
-        event = webhook.verify(payload, headers)
-    
-    except WebhookVerificationError as e:
-        logger.error(f"Clerk Webhook verification failed: {e}")
-        raise HTTPException(status_code=400, detail="Invalid webhook signature")
-    
-    event_type = event["type"]
-
-    if event_type == "user.deleted":
-        user_id = event["data"]["id"]
-
-        # Delete all media and chats associated with this user
-        chats = await db["chats"].find({ "clerk_user_id": user_id }).to_list(length=None)
-
-        for chat in chats:
-            chat_id = str(chat["_id"])
-            await delete_media_for_chat_id(chat_id)
-
-        result = await db["chats"].delete_many({ "clerk_user_id": user_id })
-        logger.info(f"Deleted {result.deleted_count} chats for Clerk user ID: {user_id}")
-    
-    return {"status": "success"}
+    return await clerk_webhooks.dispatch(payload, headers)
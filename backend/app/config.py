@@ -14,3 +14,120 @@ class Config:
     CLIENT_URL_2=os.getenv("CLIENT_URL_2")
     CLIENT_URL_3=os.getenv("CLIENT_URL_3")
     CLERK_WEBHOOK_SECRET=os.getenv("CLERK_WEBHOOK_SECRET")
+
+    # Verdict cache
+    VERDICT_CACHE_SIZE=int(os.getenv("VERDICT_CACHE_SIZE", "1024"))
+    VERDICT_CACHE_TTL_SECONDS=int(os.getenv("VERDICT_CACHE_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+
+    # Thread pools for blocking SDK calls
+    UPLOAD_POOL_SIZE=int(os.getenv("UPLOAD_POOL_SIZE", "16"))
+    INFERENCE_POOL_SIZE=int(os.getenv("INFERENCE_POOL_SIZE", "32"))
+
+    # Background video analysis jobs
+    VIDEO_JOB_WORKERS=int(os.getenv("VIDEO_JOB_WORKERS", "4"))
+    VIDEO_JOB_QUEUE_SIZE=int(os.getenv("VIDEO_JOB_QUEUE_SIZE", "100"))
+    VIDEO_JOB_TTL_SECONDS=int(os.getenv("VIDEO_JOB_TTL_SECONDS", str(24 * 60 * 60)))
+    VIDEO_JOB_EVENT_POLL_SECONDS=float(os.getenv("VIDEO_JOB_EVENT_POLL_SECONDS", "5"))
+
+    # Batch image analysis
+    BATCH_MAX_FILES=int(os.getenv("BATCH_MAX_FILES", "100"))
+    BATCH_IMAGES_PER_REQUEST=int(os.getenv("BATCH_IMAGES_PER_REQUEST", "10"))
+    BATCH_UPLOAD_CONCURRENCY=int(os.getenv("BATCH_UPLOAD_CONCURRENCY", "4"))
+    BATCH_MAX_BODY_MB=int(os.getenv("BATCH_MAX_BODY_MB", "200"))  # Whole request, rejected before it is parsed
+
+    # Memory management
+    GC_RSS_THRESHOLD_MB=int(os.getenv("GC_RSS_THRESHOLD_MB", "512"))
+    GC_MIN_INTERVAL_SECONDS=float(os.getenv("GC_MIN_INTERVAL_SECONDS", "30"))
+
+    # Chat history pagination
+    HISTORY_PAGE_SIZE=int(os.getenv("HISTORY_PAGE_SIZE", "20"))
+    HISTORY_MAX_PAGE_SIZE=int(os.getenv("HISTORY_MAX_PAGE_SIZE", "100"))
+    MESSAGE_PAGE_SIZE=int(os.getenv("MESSAGE_PAGE_SIZE", "50"))
+    MESSAGE_MAX_PAGE_SIZE=int(os.getenv("MESSAGE_MAX_PAGE_SIZE", "200"))
+
+    # Message storage: "embedded" (array in the chat document) or "collection" (messages collection).
+    # Switch to "collection" before running python -m scripts.migrate_messages.
+    MESSAGE_STORE=os.getenv("MESSAGE_STORE", "embedded")
+    MESSAGE_MIGRATION_BATCH_SIZE=int(os.getenv("MESSAGE_MIGRATION_BATCH_SIZE", "100"))
+
+    # Response cache of the chat read endpoints, per worker process.
+    # Invalidations are shared through RESPONSE_CACHE_STORE: "memory" (this process) or "mongo" (required with several workers)
+    RESPONSE_CACHE_STORE=os.getenv("RESPONSE_CACHE_STORE", "memory")
+    RESPONSE_CACHE_MAX_BYTES=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    RESPONSE_CACHE_MAX_ENTRY_BYTES=int(os.getenv("RESPONSE_CACHE_MAX_ENTRY_BYTES", str(4 * 1024 * 1024)))
+    RESPONSE_CACHE_TTL_SECONDS=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "15"))
+
+    # Media cleanup
+    MEDIA_DELETE_CONCURRENCY=int(os.getenv("MEDIA_DELETE_CONCURRENCY", "4"))
+
+    # Durable deletion queue for account deletion webhooks
+    DELETION_QUEUE_WORKERS=int(os.getenv("DELETION_QUEUE_WORKERS", "2"))
+    DELETION_QUEUE_LEASE_SECONDS=int(os.getenv("DELETION_QUEUE_LEASE_SECONDS", "300"))
+    DELETION_QUEUE_MAX_ATTEMPTS=int(os.getenv("DELETION_QUEUE_MAX_ATTEMPTS", "8"))
+    DELETION_QUEUE_BACKOFF_SECONDS=float(os.getenv("DELETION_QUEUE_BACKOFF_SECONDS", "30"))
+    DELETION_QUEUE_MAX_BACKOFF_SECONDS=float(os.getenv("DELETION_QUEUE_MAX_BACKOFF_SECONDS", "3600"))
+    DELETION_QUEUE_POLL_SECONDS=float(os.getenv("DELETION_QUEUE_POLL_SECONDS", "5"))
+    DELETION_JOB_RETENTION_SECONDS=int(os.getenv("DELETION_JOB_RETENTION_SECONDS", str(7 * 24 * 60 * 60)))
+
+    # Webhook replay protection (remembered svix message ids)
+    WEBHOOK_REPLAY_MAX_ENTRIES=int(os.getenv("WEBHOOK_REPLAY_MAX_ENTRIES", "10000"))
+    WEBHOOK_REPLAY_TTL_SECONDS=float(os.getenv("WEBHOOK_REPLAY_TTL_SECONDS", "600"))
+
+    # Gemini file activation polling
+    GEMINI_POLL_INITIAL_SECONDS=float(os.getenv("GEMINI_POLL_INITIAL_SECONDS", "0.5"))
+    GEMINI_POLL_MAX_SECONDS=float(os.getenv("GEMINI_POLL_MAX_SECONDS", "8"))
+    GEMINI_POLL_BACKOFF=float(os.getenv("GEMINI_POLL_BACKOFF", "2"))
+    GEMINI_ACTIVATION_TIMEOUT_SECONDS=float(os.getenv("GEMINI_ACTIVATION_TIMEOUT_SECONDS", "30"))
+    GEMINI_ACTIVATION_TIMEOUT_PER_MB_SECONDS=float(os.getenv("GEMINI_ACTIVATION_TIMEOUT_PER_MB_SECONDS", "3"))
+
+    # Reuse of files uploaded to Gemini, per worker process
+    GEMINI_FILE_REGISTRY_SIZE=int(os.getenv("GEMINI_FILE_REGISTRY_SIZE", "256"))
+    GEMINI_FILE_IDLE_SECONDS=float(os.getenv("GEMINI_FILE_IDLE_SECONDS", "1800"))
+    GEMINI_FILE_EXPIRY_MARGIN_SECONDS=float(os.getenv("GEMINI_FILE_EXPIRY_MARGIN_SECONDS", "600"))
+    GEMINI_FILE_REAPER_INTERVAL_SECONDS=float(os.getenv("GEMINI_FILE_REAPER_INTERVAL_SECONDS", "30"))
+
+    # Optional re-encoding of media before it is sent to Gemini (video and audio need ffmpeg)
+    PREPROCESS_ENABLED=os.getenv("PREPROCESS_ENABLED", "false").lower() == "true"
+    PREPROCESS_POOL_SIZE=int(os.getenv("PREPROCESS_POOL_SIZE", "2"))
+    PREPROCESS_TIMEOUT_SECONDS=int(os.getenv("PREPROCESS_TIMEOUT_SECONDS", "120"))
+    IMAGE_PROXY_MAX_SIDE=int(os.getenv("IMAGE_PROXY_MAX_SIDE", "1536"))
+    IMAGE_PROXY_QUALITY=int(os.getenv("IMAGE_PROXY_QUALITY", "90"))
+    VIDEO_PROXY_MAX_HEIGHT=int(os.getenv("VIDEO_PROXY_MAX_HEIGHT", "720"))
+    VIDEO_PROXY_FPS=int(os.getenv("VIDEO_PROXY_FPS", "10"))
+    VIDEO_PROXY_CRF=int(os.getenv("VIDEO_PROXY_CRF", "26"))
+    AUDIO_PROXY_SAMPLE_RATE=int(os.getenv("AUDIO_PROXY_SAMPLE_RATE", "16000"))
+
+    # Production server (python run.py --production)
+    WEB_HOST=os.getenv("WEB_HOST", "0.0.0.0")
+    WEB_PORT=int(os.getenv("WEB_PORT", "5001"))
+    WEB_WORKERS=int(os.getenv("WEB_WORKERS", "0"))  # 0 means one worker per CPU core
+    WEB_LIMIT_CONCURRENCY=int(os.getenv("WEB_LIMIT_CONCURRENCY", "256"))  # Per worker, above it new connections get a 503
+    WEB_BACKLOG=int(os.getenv("WEB_BACKLOG", "2048"))
+    WEB_KEEP_ALIVE_SECONDS=int(os.getenv("WEB_KEEP_ALIVE_SECONDS", "180"))
+    SHUTDOWN_GRACE_SECONDS=int(os.getenv("SHUTDOWN_GRACE_SECONDS", "60"))
+    SHUTDOWN_DRAIN_SECONDS=int(os.getenv("SHUTDOWN_DRAIN_SECONDS", "120"))
+    METRICS_DIR=os.getenv("METRICS_DIR", "")  # Prometheus multiprocess files, a fresh temp directory when empty
+    METRICS_SAMPLE_SECONDS=float(os.getenv("METRICS_SAMPLE_SECONDS", "5"))  # How often each worker writes its live gauges
+    METRICS_QUEUE_STATS_TIMEOUT_SECONDS=float(os.getenv("METRICS_QUEUE_STATS_TIMEOUT_SECONDS", "2"))  # Queue gauges are skipped on a slower scrape
+
+    # Admission control for the analyze endpoints, per clerk_user_id
+    RATE_LIMIT_STORE=os.getenv("RATE_LIMIT_STORE", "memory")  # "memory" (per worker) or "mongo" (shared, required with several workers)
+    RATE_LIMIT_CAPACITY=float(os.getenv("RATE_LIMIT_CAPACITY", "30"))
+    RATE_LIMIT_REFILL_PER_SECOND=float(os.getenv("RATE_LIMIT_REFILL_PER_SECOND", "0.5"))
+    RATE_LIMIT_COST_IMAGE=float(os.getenv("RATE_LIMIT_COST_IMAGE", "1"))
+    RATE_LIMIT_COST_AUDIO=float(os.getenv("RATE_LIMIT_COST_AUDIO", "3"))
+    RATE_LIMIT_COST_VIDEO=float(os.getenv("RATE_LIMIT_COST_VIDEO", "10"))
+    RATE_LIMIT_TTL_SECONDS=int(os.getenv("RATE_LIMIT_TTL_SECONDS", str(24 * 60 * 60)))
+    ADMISSION_MAX_CONCURRENT=int(os.getenv("ADMISSION_MAX_CONCURRENT", "16"))  # Per worker
+    ADMISSION_MAX_QUEUED_PER_USER=int(os.getenv("ADMISSION_MAX_QUEUED_PER_USER", "4"))
+
+    # Gemini quota governor. Budgets are per worker process, divide the project quota by the worker count.
+    GEMINI_RPM=float(os.getenv("GEMINI_RPM", "1000"))
+    GEMINI_TPM=float(os.getenv("GEMINI_TPM", "1000000"))
+    GEMINI_TOKENS_PER_REQUEST=float(os.getenv("GEMINI_TOKENS_PER_REQUEST", "2000"))  # Estimate, settled with the real usage
+    GEMINI_MAX_RETRIES=int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+    GEMINI_BACKOFF_SECONDS=float(os.getenv("GEMINI_BACKOFF_SECONDS", "1"))
+    GEMINI_MAX_BACKOFF_SECONDS=float(os.getenv("GEMINI_MAX_BACKOFF_SECONDS", "20"))
+    GEMINI_MAX_WAIT_SECONDS=float(os.getenv("GEMINI_MAX_WAIT_SECONDS", "30"))
+    GEMINI_BREAKER_THRESHOLD=int(os.getenv("GEMINI_BREAKER_THRESHOLD", "5"))
+    GEMINI_BREAKER_RESET_SECONDS=float(os.getenv("GEMINI_BREAKER_RESET_SECONDS", "30"))
@@ -0,0 +1,260 @@
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+from typing import Dict, Tuple
+import asyncio
+import math
+import time
+
+from app.config import Config
+from app.core.database import db
+from app.utils.logger import get_logger
+from app.utils.metrics import ADMISSION_REJECTIONS, ADMISSION_WAITING
+
+logger = get_logger(__name__)
+
+class MemoryBucketStore:
+    """
+        Token buckets kept in this process. Limits are per worker process.
+    """
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    def _prune(self, now: float, capacity: float, rate: float):
+        # A bucket that has refilled completely holds no information
+        full_after = capacity / rate
+        self._buckets = {
+            key: (tokens, updated_at)
+            for key, (tokens, updated_at) in self._buckets.items()
+            if now - updated_at < full_after
+        }
+
+    async def take(self, key: str, cost: float, capacity: float, rate: float) -> Tuple[bool, float]:
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * rate)
+
+        if tokens < cost:
+            self._buckets[key] = (tokens, now)
+            return False, (cost - tokens) / rate
+
+        self._buckets[key] = (tokens - cost, now)
+
+        if len(self._buckets) > self.max_keys:
+            self._prune(now, capacity, rate)
+
+        return True, 0.0
+
+    async def give(self, key: str, amount: float, capacity: float):
+        if key in self._buckets:
+            tokens, updated_at = self._buckets[key]
+            self._buckets[key] = (min(capacity, tokens + amount), updated_at)
+
+class MongoBucketStore:
+    """
+        Token buckets shared by every worker, stored in a MongoDB collection.
+        Refill and take happen in one atomic pipeline update per request.
+    """
+
+    def __init__(self, collection_name: str):
+        self.collection = db[collection_name]
+
+    async def take(self, key: str, cost: float, capacity: float, rate: float) -> Tuple[bool, float]:
+        now = datetime.now()
+        elapsed_seconds = {"$divide": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, 1000]}
+
+        bucket = await self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": {"$min": [
+                    capacity,
+                    {"$add": [{"$ifNull": ["$tokens", capacity]}, {"$multiply": [elapsed_seconds, rate]}]}
+                ]}}},
+                {"$set": {"allowed": {"$gte": ["$tokens", cost]}}},
+                {"$set": {
+                    "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", cost]}, "$tokens"]},
+                    "updated_at": now
+                }}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+        if bucket["allowed"]:
+            return True, 0.0
+
+        return False, (cost - bucket["tokens"]) / rate
+
+    async def give(self, key: str, amount: float, capacity: float):
+        await self.collection.update_one(
+            {"_id": key},
+            [{"$set": {"tokens": {"$min": [capacity, {"$add": ["$tokens", amount]}]}}}]
+        )
+
+class AdmissionController:
+    """
+        Admission for the analyze endpoints, keyed on clerk_user_id.
+        A token bucket per user limits how much work a user can start, with a
+        cost per media type. Admitted requests then wait for one of a fixed number
+        of analysis slots. Waiting users are served round robin, so one user with
+        many queued requests cannot hold back everyone else.
+    """
+
+    def __init__(
+        self,
+        store,
+        costs: Dict[str, float],
+        capacity: float,
+        refill_per_second: float,
+        max_concurrent: int,
+        max_queued_per_user: int
+    ):
+        self.store = store
+        self.costs = costs
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.max_concurrent = max_concurrent
+        self.max_queued_per_user = max_queued_per_user
+        self.active = 0
+        self._waiters: Dict[str, deque] = {}
+        self._turns = deque()
+
+    def _reject(self, media_type: str, reason: str, retry_after: float, detail: str):
+        ADMISSION_REJECTIONS.labels(media_type, reason).inc()
+
+        raise HTTPException(
+            status_code=429,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+    async def charge(self, clerk_user_id: str, media_type: str, units: int = 1):
+        """
+            Takes the cost of the request from the user's bucket, or raises a 429 response.
+            A request costing more than the capacity is refused with a 413 response.
+            A request that costs nothing leaves the bucket untouched.
+        """
+
+        cost = self.costs[media_type] * units
+
+        if cost <= 0:
+            return
+
+        if cost > self.capacity:
+            # No bucket ever holds that much, a retry cannot succeed
+            ADMISSION_REJECTIONS.labels(media_type, "too_large").inc()
+            raise HTTPException(
+                status_code=413,
+                detail=f"At most {math.floor(self.capacity / self.costs[media_type])} {media_type} analyses fit in one request, this one needs {units}."
+            )
+
+        try:
+            allowed, retry_after = await self.store.take(clerk_user_id, cost, self.capacity, self.refill_per_second)
+        except Exception as e:
+            # The limiter must not take the service down with it
+            logger.error(f"Failed to read rate limit of user {clerk_user_id}, admitting. Error: {e}")
+            return
+
+        if not allowed:
+            self._reject(media_type, "rate_limited", retry_after, "Too many analyses, try again later.")
+
+    async def refund(self, clerk_user_id: str, media_type: str, units: int = 1):
+        """
+            Gives back the cost of a charged request that was turned away before any work started.
+        """
+
+        try:
+            await self.store.give(clerk_user_id, self.costs[media_type] * units, self.capacity)
+        except Exception as e:
+            logger.error(f"Failed to refund rate limit of user {clerk_user_id}. Error: {e}")
+
+    async def _acquire(self, clerk_user_id: str):
+        if self.active < self.max_concurrent and not self._turns:
+            self.active += 1
+            return
+
+        waiters = self._waiters.setdefault(clerk_user_id, deque())
+        waiter = asyncio.get_running_loop().create_future()
+
+        if not waiters:
+            self._turns.append(clerk_user_id)
+
+        waiters.append(waiter)
+        ADMISSION_WAITING.inc()
+
+        try:
+            # The slot is handed over by _release, active is already counted
+            await waiter
+
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            else:
+                self._forget(clerk_user_id, waiter)
+            raise
+
+        finally:
+            ADMISSION_WAITING.dec()
+
+    def _forget(self, clerk_user_id: str, waiter: asyncio.Future):
+        waiters = self._waiters.get(clerk_user_id)
+
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+
+            if not waiters:
+                del self._waiters[clerk_user_id]
+                self._turns.remove(clerk_user_id)
+
+    def _release(self):
+        # Hand the slot to the first waiter of the next user in turn
+        while self._turns:
+            clerk_user_id = self._turns.popleft()
+            waiters = self._waiters[clerk_user_id]
+            waiter = waiters.popleft()
+
+            if waiters:
+                self._turns.append(clerk_user_id)
+            else:
+                del self._waiters[clerk_user_id]
+
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+        self.active -= 1
+
+    @asynccontextmanager
+    async def admit(self, clerk_user_id: str, media_type: str, units: int = 1):
+        """
+            Charges the request and holds an analysis slot while the block runs.
+            Raises a 429 response when the user is over budget or has too many requests waiting.
+        """
+
+        if len(self._waiters.get(clerk_user_id, ())) >= self.max_queued_per_user:
+            self._reject(media_type, "queue_full", 1, "Too many analyses waiting, try again later.")
+
+        await self.charge(clerk_user_id, media_type, units)
+        await self._acquire(clerk_user_id)
+
+        try:
+            yield
+        finally:
+            self._release()
+
+admission = AdmissionController(
+    store=MongoBucketStore("rate_limits") if Config.RATE_LIMIT_STORE == "mongo" else MemoryBucketStore(),
+    costs={
+        "image": Config.RATE_LIMIT_COST_IMAGE,
+        "audio": Config.RATE_LIMIT_COST_AUDIO,
+        "video": Config.RATE_LIMIT_COST_VIDEO
+    },
+    capacity=Config.RATE_LIMIT_CAPACITY,
+    refill_per_second=Config.RATE_LIMIT_REFILL_PER_SECOND,
+    max_concurrent=Config.ADMISSION_MAX_CONCURRENT,
+    max_queued_per_user=Config.ADMISSION_MAX_QUEUED_PER_USER
+)
@@ -1,8 +1,14 @@
 import cloudinary
+import cloudinary.api
 import cloudinary.uploader
 
 from app.config import Config
-from app.utils.logger import logger
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Maximum number of public ids accepted by one delete_resources call
+CLOUDINARY_DELETE_BATCH_SIZE = 100
 
 cloudinary.config(
     cloud_name = Config.CLOUDINARY_CLOUD_NAME,
@@ -54,3 +60,18 @@ def delete_resource(public_id: str, resource_type: str) -> dict:
     except Exception as e:
         logger.error(f"Failed to delete resource with public_id: {public_id}. Error: {e}")
         return None
+
+def delete_resources(public_ids: list, resource_type: str) -> dict:
+    """
+        Deletes up to 100 images, videos or audios from Cloudinary with a single API call.
+    """
+
+    try:
+        response = cloudinary.api.delete_resources(public_ids, resource_type=resource_type, type="upload")
+
+        logger.info(f"Deleted {len(public_ids)} {resource_type} resources from Cloudinary.")
+        return response
+
+    except Exception as e:
+        logger.error(f"Failed to delete {len(public_ids)} {resource_type} resources. Error: {e}")
+        return None
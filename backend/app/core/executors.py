@@ -0,0 +1,58 @@
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+import asyncio
+import contextvars
+import multiprocessing
+
+from app.config import Config
+
+# Blocking SDK calls run on these pools so they never stall the event loop.
+# Uploads (Cloudinary, file hashing) and inference (Gemini) get separate pools,
+# so a burst of slow video analyses cannot starve uploads and vice versa.
+# Calls run in a copy of the caller's context, so their logs carry the request id.
+upload_executor = ThreadPoolExecutor(
+    max_workers=Config.UPLOAD_POOL_SIZE,
+    thread_name_prefix="upload"
+)
+
+inference_executor = ThreadPoolExecutor(
+    max_workers=Config.INFERENCE_POOL_SIZE,
+    thread_name_prefix="inference"
+)
+
+# Re-encoding media before analysis is CPU bound, so it runs in worker processes.
+# Workers are spawned rather than forked, since this process holds threads and sockets.
+preprocess_executor = ProcessPoolExecutor(
+    max_workers=Config.PREPROCESS_POOL_SIZE,
+    mp_context=multiprocessing.get_context("spawn")
+)
+
+def submit_upload(func, *args, **kwargs) -> Future:
+    """
+        Schedules a blocking upload or file I/O call on the upload pool.
+    """
+
+    return upload_executor.submit(contextvars.copy_context().run, partial(func, *args, **kwargs))
+
+def submit_inference(func, *args, **kwargs) -> Future:
+    """
+        Schedules a blocking LLM call on the inference pool.
+    """
+
+    return inference_executor.submit(contextvars.copy_context().run, partial(func, *args, **kwargs))
+
+async def run_upload(func, *args, **kwargs):
+    """
+        Runs a blocking upload or file I/O call on the upload pool.
+    """
+
+    return await asyncio.wrap_future(submit_upload(func, *args, **kwargs))
+
+def shutdown_executors():
+    """
+        Waits for running calls to finish and stops the worker threads.
+    """
+
+    upload_executor.shutdown(wait=True, cancel_futures=True)
+    inference_executor.shutdown(wait=True, cancel_futures=True)
+    preprocess_executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,136 @@
+from bson import ObjectId
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from app.config import Config
+from app.core.database import db
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Indexes every collection needs, created idempotently at startup.
+INDEXES = {
+    "chats": [
+        # Chat history, sorted newest first and paginated on (created_at, _id)
+        IndexModel([("user_email", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+        # Account deletion webhooks
+        IndexModel([("clerk_user_id", ASCENDING)]),
+        # Shared media check before deleting a Cloudinary asset
+        IndexModel([("messages.content", ASCENDING)])
+    ],
+    "messages": [
+        # Paginated message reads of a chat, on (created_at, _id)
+        IndexModel([("chat_id", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)]),
+        # Idempotent migration of embedded messages
+        IndexModel([("chat_id", ASCENDING), ("id", ASCENDING)], unique=True),
+        # Shared media check before deleting a Cloudinary asset
+        IndexModel([("content", ASCENDING)])
+    ],
+    "verdict_cache": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+        IndexModel([("document_url", ASCENDING)])
+    ],
+    "video_jobs": [
+        IndexModel([("created_at", ASCENDING)], expireAfterSeconds=Config.VIDEO_JOB_TTL_SECONDS)
+    ],
+    "rate_limits": [
+        # Buckets of users that went quiet, they would have refilled long ago
+        IndexModel([("updated_at", ASCENDING)], expireAfterSeconds=Config.RATE_LIMIT_TTL_SECONDS)
+    ],
+    "cache_generations": [
+        # Tags not invalidated for an hour, every cached response from before has expired
+        IndexModel([("updated_at", ASCENDING)], expireAfterSeconds=int(Config.RESPONSE_CACHE_TTL_SECONDS) + 3600)
+    ],
+    "deletion_jobs": [
+        # Claiming the next job that is ready to run
+        IndexModel([("status", ASCENDING), ("available_at", ASCENDING)]),
+        # Finished jobs are kept long enough to deduplicate webhook retries
+        IndexModel([("completed_at", ASCENDING)], expireAfterSeconds=Config.DELETION_JOB_RETENTION_SECONDS)
+    ]
+}
+
+# Queries on the request path, with sample values. None of them may scan a whole collection.
+HOT_QUERIES = [
+    ("chat history", "chats", {"user_email": "user@example.com"}, {"created_at": -1}),
+    ("chat history page", "chats", {"user_email": "user@example.com"}, {"created_at": -1, "_id": -1}),
+    ("chats of clerk user", "chats", {"clerk_user_id": "user_123"}, None),
+    ("shared media check", "chats", {"messages.content": {"$in": ["https://res.cloudinary.com/example.png"]}}, None),
+    ("chat messages page", "messages", {"chat_id": ObjectId("000000000000000000000000")}, {"created_at": -1, "_id": -1}),
+    ("shared media check in messages", "messages", {"content": {"$in": ["https://res.cloudinary.com/example.png"]}}, None),
+    ("deletion queue lag", "deletion_jobs", {"status": "pending", "available_at": {"$lte": datetime(2024, 1, 1)}}, {"available_at": 1}),
+    ("verdict cache invalidation", "verdict_cache", {"document_url": {"$in": ["https://res.cloudinary.com/example.png"]}}, None)
+]
+
+async def _sync_ttl(collection_name: str, index: IndexModel):
+    """
+        Updates expireAfterSeconds of an existing TTL index when the configured TTL changed.
+    """
+
+    document = index.document
+
+    await db.command(
+        "collMod",
+        collection_name,
+        index={"name": document["name"], "expireAfterSeconds": document["expireAfterSeconds"]}
+    )
+
+async def ensure_indexes():
+    """
+        Creates every index in INDEXES that does not exist yet.
+        Safe to run on every startup, existing indexes are left untouched.
+    """
+
+    for collection_name, indexes in INDEXES.items():
+        try:
+            created = await db[collection_name].create_indexes(indexes)
+            logger.info(f"Indexes ready on {collection_name}: {', '.join(created)}")
+
+        except OperationFailure as e:
+            # An index with the same name but another TTL (code 85) is updated in place
+            ttl_indexes = [index for index in indexes if "expireAfterSeconds" in index.document]
+
+            if e.code != 85 or not ttl_indexes:
+                logger.error(f"Failed to create indexes on {collection_name}. Error: {e}")
+                continue
+
+            for index in ttl_indexes:
+                await _sync_ttl(collection_name, index)
+
+            await db[collection_name].create_indexes(indexes)
+            logger.info(f"Indexes ready on {collection_name} after updating TTL")
+
+        except Exception as e:
+            logger.error(f"Failed to create indexes on {collection_name}. Error: {e}")
+
+def _plan_stages(plan: dict):
+    yield plan.get("stage")
+
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _plan_stages(plan[key])
+
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+async def find_collection_scans() -> list:
+    """
+        Explains every hot query and returns the names of those whose winning plan contains COLLSCAN.
+    """
+
+    scans = []
+
+    for name, collection_name, query, sort in HOT_QUERIES:
+        command = {"find": collection_name, "filter": query}
+
+        if sort:
+            command["sort"] = sort
+
+        explanation = await db.command("explain", command, verbosity="queryPlanner")
+        winning_plan = explanation["queryPlanner"]["winningPlan"]
+
+        if "COLLSCAN" in _plan_stages(winning_plan):
+            logger.error(f"Query '{name}' on {collection_name} scans the whole collection")
+            scans.append(name)
+
+    return scans
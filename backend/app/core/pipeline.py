@@ -0,0 +1,558 @@
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from fastapi import HTTPException, UploadFile
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import math
+import threading
+import time
+
+from app.core.admission import admission
+from app.core.cloudinary_client import upload_image, upload_video, upload_audio
+from app.config import Config
+from app.core.executors import submit_upload, submit_inference
+from app.crud.account_deletion import queue_orphaned_media
+from app.crud.chat_messages import build_messages, save_messages
+from app.crud.verdict_cache import verdict_cache, build_cache_key
+from app.utils.gemini_client import GeminiUnavailable, cancel_event_var
+from app.utils.ingest import ingest_upload
+from app.utils.gemini_files import file_registry
+from app.utils.llm_analysis import (
+    analyze_image_with_llm, analyze_video_with_llm, analyze_audio_with_llm, analyze_image_batch_with_llm,
+    build_file_key, upload_file_to_gemini, release_gemini_file
+)
+from app.utils.logger import get_logger
+from app.utils.metrics import ERRORS, STAGE_SECONDS, UNKNOWN_VERDICTS, time_stage
+from app.utils.preprocess import preprocessor
+from app.utils.temp_files import remove_temp_file
+
+logger = get_logger(__name__)
+
+MAX_FILE_SIZE = 50 * 1024 * 1024  # 50 MB
+
+# Cloudinary only needs the original file, so the upload is started before
+# preprocessing and runs in the background while the file is analyzed.
+STAGES = ("ingest", "upload", "preprocess", "infer", "persist")
+
+# Stages that are skipped when the verdict cache already has the file
+CACHED_STAGES = ("upload", "preprocess", "infer")
+
+@dataclass
+class AnalysisContext:
+    """
+        State of one analysis as it moves through the pipeline stages.
+    """
+
+    clerk_user_id: str
+    email: str
+    mime_type: str
+    chat_id: Optional[str] = None
+    file: Optional[UploadFile] = None
+
+    # Analyze again even when the verdict cache has the file, reusing its Cloudinary URL and live Gemini upload
+    reanalyze: bool = False
+
+    # Set by the ingest stage, or by the caller when the file was ingested already
+    temp_file_path: Optional[str] = None
+    content_hash: Optional[str] = None
+    cache_key: Optional[str] = None
+    file_key: Optional[str] = None
+    cached: bool = False
+
+    # File sent to Gemini, a preprocessed proxy or the original
+    analysis_path: Optional[str] = None
+    analysis_mime_type: Optional[str] = None
+    analyze_kwargs: dict = field(default_factory=dict)
+
+    document_url: Optional[str] = None
+    label: Optional[str] = None
+    confidence: Optional[float] = None
+    reason: Optional[str] = None
+    user_message: Optional[dict] = None
+    ai_message: Optional[dict] = None
+
+    # Cloudinary URLs uploaded by this run, deleted again when the run fails
+    uploaded_urls: list = field(default_factory=list)
+    failed: bool = False
+
+    # Pool calls that still read the temporary files, background stages by name, and seconds spent per stage
+    readers: list = field(default_factory=list)
+    futures: Dict[str, asyncio.Future] = field(default_factory=dict)
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    # Awaited on the event loop after every stage completes
+    on_stage: Optional[Callable[[str], Awaitable[None]]] = None
+
+    def response(self) -> dict:
+        return {
+            "chat_id": self.chat_id,
+            "user_message": self.user_message,
+            "ai_message": self.ai_message
+        }
+
+@dataclass
+class BatchContext(AnalysisContext):
+    """
+        State of a batch analysis: one item context per file, moving through the
+        stages together. `mime_type` is the fallback for files of unknown type.
+    """
+
+    files: List[UploadFile] = field(default_factory=list)
+    items: List[AnalysisContext] = field(default_factory=list)
+
+    # Bounds the pool calls of the batch, set by the ingest stage
+    upload_slots: Optional[asyncio.Semaphore] = None
+
+    @property
+    def misses(self) -> List[AnalysisContext]:
+        return [item for item in self.items if not item.cached]
+
+    def response(self) -> dict:
+        return {
+            "chat_id": self.chat_id,
+            "results": [{"user_message": item.user_message, "ai_message": item.ai_message} for item in self.items]
+        }
+
+class AnalysisPipeline:
+    """
+        Runs one upload through ingest, upload, preprocess, infer and persist.
+        Every stage is an async callable taking the context, and can be replaced
+        per instance through `stages`. A stage that returns a pool future runs in
+        the background: it is timed and reported when the future completes, and
+        later stages wait for it through `context.futures`. Until then it is
+        watched alongside the foreground stages: if it fails, the running stage
+        is cancelled instead of being allowed to finish first.
+    """
+
+    def __init__(
+        self,
+        media_type: str,
+        upload: Callable[[str], str],
+        analyze: Callable[..., tuple],
+        max_size: int = MAX_FILE_SIZE,
+        stages: Optional[Dict[str, Callable[[AnalysisContext], Awaitable]]] = None,
+        metrics_label: Optional[str] = None
+    ):
+        self.media_type = media_type
+        self.metrics_label = metrics_label or media_type
+        self.upload_func = upload
+        self.analyze_func = analyze
+        self.max_size = max_size
+        self.stages = {name: getattr(self, name) for name in STAGES}
+        self.stages.update(stages or {})
+
+    async def ingest(self, context: AnalysisContext):
+        # Stream the upload to a temporary file, hashing and sniffing it on the way
+        if context.temp_file_path is None:
+            with time_stage(self.metrics_label, "temp_file_write"):
+                ingested = await ingest_upload(context.file, self.media_type, self.max_size)
+
+            context.temp_file_path = ingested.path
+            context.content_hash = ingested.content_hash
+
+        # Reuse the verdict and Cloudinary URL if this exact file was analyzed before
+        context.cache_key = build_cache_key(context.content_hash, self.media_type)
+        context.file_key = build_file_key(context.content_hash, self.media_type)
+        cached_verdict = await verdict_cache.get(context.cache_key)
+
+        if cached_verdict and context.reanalyze:
+            context.document_url = cached_verdict["document_url"]
+            logger.info(f"Analyzing {self.media_type} again: {context.document_url}")
+
+        elif cached_verdict:
+            context.cached = True
+            context.document_url = cached_verdict["document_url"]
+            context.label = cached_verdict["label"]
+            context.confidence = cached_verdict["confidence"]
+            context.reason = cached_verdict["reason"]
+            logger.info(f"Verdict cache hit for {self.media_type}: {context.document_url}")
+
+    def _recorded_upload(self, context: AnalysisContext) -> Callable[[str], str]:
+        """
+            Wraps the upload function so every finished upload is recorded in the context,
+            including uploads that finish in the pool after the run failed.
+        """
+
+        loop = asyncio.get_running_loop()
+
+        def upload(file_path: str) -> str:
+            document_url = self.upload_func(file_path)
+            context.uploaded_urls.append(document_url)
+
+            if context.failed:
+                asyncio.run_coroutine_threadsafe(queue_orphaned_media([document_url], self.media_type), loop)
+
+            return document_url
+
+        return upload
+
+    async def upload(self, context: AnalysisContext) -> Optional[Future]:
+        # Media analyzed again is on Cloudinary already
+        if context.document_url:
+            return None
+
+        return submit_upload(self._recorded_upload(context), context.temp_file_path)
+
+    async def preprocess(self, context: AnalysisContext):
+        # Gemini still has this file from an earlier analysis, nothing will be uploaded
+        if file_registry.contains(context.file_key):
+            context.analysis_path = context.temp_file_path
+            context.analysis_mime_type = context.mime_type
+            return
+
+        proxy = await preprocessor.prepare_async(context.temp_file_path, self.media_type, context.mime_type)
+        context.analysis_path = proxy.path
+        context.analysis_mime_type = proxy.mime_type
+
+    async def _analyze(self, context: AnalysisContext, *args, **kwargs):
+        """
+            Runs the analyze function on the inference pool and returns its result.
+        """
+
+        cancel_event = threading.Event()
+        token = cancel_event_var.set(cancel_event)
+
+        try:
+            future = submit_inference(self.analyze_func, *args, **kwargs)
+        finally:
+            cancel_event_var.reset(token)
+
+        context.readers.append(future)
+
+        try:
+            return await asyncio.wrap_future(future)
+
+        except asyncio.CancelledError:
+            # The analysis may have started already, it stops before its next Gemini request
+            cancel_event.set()
+            raise
+
+    async def infer(self, context: AnalysisContext):
+        context.label, context.confidence, context.reason = await self._analyze(
+            context,
+            context.analysis_path,
+            context.analysis_mime_type,
+            file_key=context.file_key,
+            **context.analyze_kwargs
+        )
+
+        if context.label == "Unknown":
+            UNKNOWN_VERDICTS.labels(self.metrics_label).inc()
+
+    async def persist(self, context: AnalysisContext):
+        if not context.cached:
+            if "upload" in context.futures:
+                context.document_url = await context.futures["upload"]
+                logger.info(f"{self.media_type.capitalize()} uploaded to Cloudinary: {context.document_url}")
+
+            await verdict_cache.set(context.cache_key, context.document_url, context.label, context.confidence, context.reason, context.file_key)
+
+        context.user_message, context.ai_message = build_messages(
+            self.media_type, context.document_url, context.label, context.confidence, context.reason
+        )
+
+        with time_stage(self.metrics_label, "mongo_write"):
+            context.chat_id, _ = await save_messages(
+                context.chat_id, context.clerk_user_id, context.email, self.media_type, [context.user_message, context.ai_message]
+            )
+
+        logger.info(f"Analysis of {self.media_type} saved to chat_id: {context.chat_id}")
+
+    def _track(self, context: AnalysisContext, name: str, future, started: float):
+        loop = asyncio.get_running_loop()
+
+        # A stage may also return a task, which tracks its own pool calls as readers
+        if isinstance(future, Future):
+            context.readers.append(future)
+            context.futures[name] = asyncio.wrap_future(future)
+        else:
+            context.futures[name] = future
+
+        # Marks the error retrieved when nothing awaits the stage anymore, it is counted below
+        context.futures[name].add_done_callback(lambda wrapped: wrapped.cancelled() or wrapped.exception())
+
+        def done(future):
+            context.timings[name] = time.perf_counter() - started
+            STAGE_SECONDS.labels(self.metrics_label, name).observe(context.timings[name])
+
+            if future.cancelled():
+                return
+
+            if future.exception():
+                ERRORS.labels(self.metrics_label, name).inc()
+            elif context.on_stage:
+                asyncio.run_coroutine_threadsafe(context.on_stage(name), loop)
+
+        future.add_done_callback(done)
+
+    @staticmethod
+    def _background_failure(context: AnalysisContext) -> Optional[BaseException]:
+        for future in context.futures.values():
+            if future.done() and not future.cancelled() and future.exception():
+                return future.exception()
+
+        return None
+
+    async def _run_stage(self, context: AnalysisContext, name: str):
+        """
+            Runs a foreground stage until it returns, or until a background stage
+            fails first. The stage is then cancelled and the background error raised.
+        """
+
+        stage = asyncio.ensure_future(self.stages[name](context))
+
+        try:
+            while True:
+                failure = self._background_failure(context)
+
+                if failure:
+                    stage.cancel()
+                    await asyncio.wait({stage})
+
+                    if not stage.cancelled():
+                        stage.exception()
+
+                    raise failure
+
+                if stage.done():
+                    return stage.result()
+
+                pending = {future for future in context.futures.values() if not future.done()}
+                await asyncio.wait({stage, *pending}, return_when=asyncio.FIRST_COMPLETED)
+
+        except BaseException:
+            stage.cancel()
+            raise
+
+    async def run(self, context: AnalysisContext) -> AnalysisContext:
+        """
+            Runs every stage in order, background stages alongside the later ones.
+            The temporary files are deleted once the pool calls reading them are done,
+            also when a stage fails.
+        """
+
+        try:
+            for name in STAGES:
+                started = time.perf_counter()
+
+                if not (context.cached and name in CACHED_STAGES):
+                    result = await self._run_stage(context, name)
+
+                    if isinstance(result, (Future, asyncio.Future)):
+                        self._track(context, name, result, started)
+                        continue
+
+                context.timings[name] = time.perf_counter() - started
+                STAGE_SECONDS.labels(self.metrics_label, name).observe(context.timings[name])
+
+                if context.on_stage:
+                    await context.on_stage(name)
+
+        except BaseException as e:
+            # A failed background stage was counted under its own name when it completed
+            if isinstance(e, Exception) and e is not self._background_failure(context):
+                ERRORS.labels(self.metrics_label, name).inc()
+
+            for future in context.readers:
+                future.cancel()
+
+            # Nothing references the media uploaded so far, uploads still running queue themselves
+            context.failed = True
+            await queue_orphaned_media(list(context.uploaded_urls), self.media_type)
+            raise
+
+        finally:
+            self._remove_temp_files(context)
+
+        logger.info(
+            f"{self.media_type.capitalize()} analysis stages: "
+            + ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in context.timings.items())
+        )
+
+        return context
+
+    def _remove_temp_files(self, context: AnalysisContext, readers: Optional[list] = None):
+        # Calls that already started cannot be interrupted, the files outlive them
+        readers = context.readers if readers is None else readers
+
+        if context.analysis_path and context.analysis_path != context.temp_file_path:
+            remove_temp_file(context.analysis_path, readers)
+
+        if context.temp_file_path:
+            remove_temp_file(context.temp_file_path, readers)
+
+    def units(self, context: AnalysisContext) -> int:
+        """
+            Admission units charged for the analysis.
+        """
+
+        return 1
+
+    async def handle(self, context: AnalysisContext) -> dict:
+        """
+            Runs the pipeline for an endpoint, once admission control lets the user in,
+            and returns its response. Unexpected errors are turned into a 500 response.
+        """
+
+        try:
+            async with admission.admit(context.clerk_user_id, self.media_type, units=self.units(context)):
+                await self.run(context)
+
+        except HTTPException as he:
+            raise he
+        except GeminiUnavailable as e:
+            logger.error(f"Gemini unavailable for {self.media_type} analysis: {str(e)}")
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+        except Exception as e:
+            logger.error(f"Error in uploading or analyzing {self.media_type}: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+        return context.response()
+
+class BatchAnalysisPipeline(AnalysisPipeline):
+    """
+        Runs many uploads through the same stages as one analysis.
+        Every file gets its own item context and verdict cache lookup, only the misses
+        are uploaded and analyzed: Gemini gets `group_size` files per request, and the
+        Cloudinary and Gemini uploads of a batch share `concurrency` upload threads.
+        All messages are saved to one chat with a single write.
+        The user is charged one `media_type` analysis per miss, after the cache lookups.
+        `analyze` takes a list of Gemini file handles and returns one verdict per file.
+    """
+
+    def __init__(self, media_type: str, upload: Callable[[str], str], analyze: Callable[[list], list], group_size: int, concurrency: int, **kwargs):
+        super().__init__(media_type, upload, analyze, **kwargs)
+        self.group_size = group_size
+        self.concurrency = concurrency
+
+    async def _bounded_upload(self, context: BatchContext, func, *args):
+        # Keeps one batch from taking every thread of the shared upload pool
+        async with context.upload_slots:
+            future = submit_upload(func, *args)
+            context.readers.append(future)
+            return await asyncio.wrap_future(future)
+
+    async def ingest(self, context: BatchContext):
+        ingest_item = super().ingest
+        context.upload_slots = asyncio.Semaphore(self.concurrency)
+
+        for file in context.files:
+            item = AnalysisContext(context.clerk_user_id, context.email, context.mime_type, file=file)
+            context.items.append(item)
+
+            with time_stage(self.metrics_label, "temp_file_write"):
+                ingested = await ingest_upload(file, self.media_type, self.max_size)
+
+            item.temp_file_path = ingested.path
+            item.content_hash = ingested.content_hash
+            item.mime_type = ingested.detected_mime_type or file.content_type or context.mime_type
+
+        # Reuse the verdicts and Cloudinary URLs of files that were analyzed before
+        await asyncio.gather(*[ingest_item(item) for item in context.items])
+        context.cached = not context.misses
+
+        # Only the misses reach Gemini, cached verdicts are free
+        if context.misses:
+            await admission.charge(context.clerk_user_id, self.media_type, units=len(context.misses))
+
+    async def upload(self, context: BatchContext) -> asyncio.Future:
+        async def upload_misses() -> list:
+            misses = context.misses
+            upload = self._recorded_upload(context)
+            document_urls = await asyncio.gather(*[self._bounded_upload(context, upload, item.temp_file_path) for item in misses])
+
+            for item, document_url in zip(misses, document_urls):
+                item.document_url = document_url
+
+            logger.info(f"Uploaded {len(misses)} {self.media_type} files to Cloudinary, {len(context.items) - len(misses)} served from the verdict cache")
+            return document_urls
+
+        return asyncio.ensure_future(upload_misses())
+
+    async def preprocess(self, context: BatchContext):
+        preprocess_item = super().preprocess
+        await asyncio.gather(*[preprocess_item(item) for item in context.misses])
+
+    async def _infer_group(self, context: BatchContext, group: List[AnalysisContext]):
+        results = await asyncio.gather(
+            *[
+                self._bounded_upload(context, upload_file_to_gemini, item.analysis_path, item.analysis_mime_type, self.metrics_label, item.file_key)
+                for item in group
+            ],
+            return_exceptions=True
+        )
+        uploaded_files = [result for result in results if not isinstance(result, BaseException)]
+        failed = True
+
+        try:
+            if len(uploaded_files) < len(group):
+                raise next(result for result in results if isinstance(result, BaseException))
+
+            verdicts = await self._analyze(context, uploaded_files)
+            failed = False
+
+        finally:
+            # Files analyzed again soon reuse the uploads, see app/utils/gemini_files.py
+            for uploaded_file in uploaded_files:
+                submit_upload(release_gemini_file, uploaded_file, failed)
+
+        for item, (label, confidence, reason) in zip(group, verdicts):
+            item.label, item.confidence, item.reason = label, confidence, reason
+
+            if label == "Unknown":
+                UNKNOWN_VERDICTS.labels(self.metrics_label).inc()
+
+    async def infer(self, context: BatchContext):
+        misses = context.misses
+        groups = [
+            asyncio.ensure_future(self._infer_group(context, misses[start:start + self.group_size]))
+            for start in range(0, len(misses), self.group_size)
+        ]
+
+        try:
+            await asyncio.gather(*groups)
+
+        except BaseException:
+            for group in groups:
+                group.cancel()
+            raise
+
+    async def persist(self, context: BatchContext):
+        if not context.cached:
+            await context.futures["upload"]
+
+            for item in context.misses:
+                await verdict_cache.set(item.cache_key, item.document_url, item.label, item.confidence, item.reason, item.file_key)
+
+        messages = []
+
+        for item in context.items:
+            item.user_message, item.ai_message = build_messages(
+                self.media_type, item.document_url, item.label, item.confidence, item.reason
+            )
+            messages.extend([item.user_message, item.ai_message])
+
+        with time_stage(self.metrics_label, "mongo_write"):
+            context.chat_id, _ = await save_messages(context.chat_id, context.clerk_user_id, context.email, self.media_type, messages)
+
+        logger.info(f"Batch analysis of {len(context.items)} {self.media_type} files saved to chat_id: {context.chat_id}")
+
+    def _remove_temp_files(self, context: BatchContext, readers: Optional[list] = None):
+        for item in context.items:
+            super()._remove_temp_files(item, context.readers)
+
+    def units(self, context: BatchContext) -> int:
+        # Charged once the verdict cache lookups are done, one unit per image analyzed, see ingest
+        return 0
+
+image_pipeline = AnalysisPipeline("image", upload=upload_image, analyze=analyze_image_with_llm)
+video_pipeline = AnalysisPipeline("video", upload=upload_video, analyze=analyze_video_with_llm)
+audio_pipeline = AnalysisPipeline("audio", upload=upload_audio, analyze=analyze_audio_with_llm)
+image_batch_pipeline = BatchAnalysisPipeline(
+    "image",
+    upload=upload_image,
+    analyze=analyze_image_batch_with_llm,
+    group_size=Config.BATCH_IMAGES_PER_REQUEST,
+    concurrency=Config.BATCH_UPLOAD_CONCURRENCY,
+    metrics_label="image_batch"
+)
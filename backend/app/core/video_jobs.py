@@ -0,0 +1,257 @@
+from datetime import datetime
+from fastapi.encoders import jsonable_encoder
+from typing import Optional
+import asyncio
+import json
+import uuid
+
+from app.config import Config
+from app.core.database import db
+from app.core.pipeline import AnalysisContext, video_pipeline
+from app.utils.logger import get_logger, request_id_var
+from app.utils.metrics import VIDEO_JOBS_QUEUED, sample_gauge
+from app.utils.temp_files import remove_temp_file
+
+logger = get_logger(__name__)
+
+# Stages reported for every job, in the order they normally happen.
+# The Cloudinary upload runs in parallel with the analysis, so "uploaded" may arrive after "gemini_active" or "analyzed".
+JOB_STAGES = ["received", "uploaded", "gemini_active", "analyzed", "persisted"]
+
+# Job stage recorded when a pipeline stage completes
+PIPELINE_STAGES = {"upload": "uploaded", "infer": "analyzed", "persist": "persisted"}
+
+class VideoJobQueue:
+    """
+        Background queue for video analysis jobs.
+        Job state lives in MongoDB so any worker process can report it,
+        while the work itself runs on asyncio tasks inside this process.
+    """
+
+    def __init__(self, collection_name: str, max_size: int, worker_count: int):
+        self.collection = db[collection_name]
+        self.queue = asyncio.Queue(maxsize=max_size)
+        self.worker_count = worker_count
+        self.workers = []
+        self.subscribers = {}
+
+        sample_gauge(VIDEO_JOBS_QUEUED, lambda: self.queue.qsize())
+
+    async def start(self):
+        """
+            Starts the worker tasks. Called from the app lifespan.
+        """
+
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+        logger.info(f"Started {self.worker_count} video job workers.")
+
+    async def stop(self, drain_seconds: float = 0):
+        """
+            Fails the jobs that never started, gives running jobs up to
+            drain_seconds to finish, then stops the workers.
+        """
+
+        queued_jobs = []
+
+        while not self.queue.empty():
+            queued_jobs.append(self.queue.get_nowait())
+            self.queue.task_done()
+
+        for job in queued_jobs:
+            remove_temp_file(job["temp_file_path"])
+            await self._set_status(job["job_id"], "failed", error="Server shut down before the job started")
+
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=drain_seconds)
+        except asyncio.TimeoutError:
+            logger.warning(f"Video jobs still running after {drain_seconds}s, cancelling them.")
+
+        for worker in self.workers:
+            worker.cancel()
+
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def submit(self, temp_file_path: str, content_hash: str, mime_type: str, clerk_user_id: str, email: str, chat_id: Optional[str]) -> str:
+        """
+            Records a new job and queues it. Raises asyncio.QueueFull when the queue is full.
+            The queue takes ownership of the temporary file.
+        """
+
+        if self.queue.full():
+            raise asyncio.QueueFull()
+
+        job_id = uuid.uuid4().hex
+        now = datetime.now()
+
+        await self.collection.insert_one({
+            "_id": job_id,
+            "status": "queued",
+            "stage": "received",
+            "stages": [{"stage": "received", "at": now}],
+            "clerk_user_id": clerk_user_id,
+            "user_email": email,
+            "chat_id": chat_id,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now
+        })
+
+        try:
+            self.queue.put_nowait({
+                "job_id": job_id,
+                "temp_file_path": temp_file_path,
+                "content_hash": content_hash,
+                "mime_type": mime_type,
+                "clerk_user_id": clerk_user_id,
+                "email": email,
+                "chat_id": chat_id
+            })
+
+        except asyncio.QueueFull:
+            # Another request filled the queue while the job was inserted, no worker will ever pick it up
+            await self.collection.delete_one({"_id": job_id})
+            raise
+
+        logger.info(f"Queued video job {job_id}, queue depth: {self.queue.qsize()}")
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"_id": job_id})
+
+    async def record_stage(self, job_id: str, stage: str, **fields):
+        now = datetime.now()
+
+        await self.collection.update_one(
+            {"_id": job_id},
+            {
+                "$set": {"stage": stage, "updated_at": now, **fields},
+                "$push": {"stages": {"stage": stage, "at": now}}
+            }
+        )
+
+        self._notify(job_id)
+
+    async def _set_status(self, job_id: str, status: str, **fields):
+        await self.collection.update_one(
+            {"_id": job_id},
+            {"$set": {"status": status, "updated_at": datetime.now(), **fields}}
+        )
+
+        self._notify(job_id)
+
+    def _notify(self, job_id: str):
+        for wakeup in self.subscribers.get(job_id, ()):
+            wakeup.set()
+
+    def _stage_callback(self, job_id: str, stage: str):
+        """
+            Returns a callback that records a stage from a pool thread.
+        """
+
+        loop = asyncio.get_running_loop()
+
+        def callback():
+            asyncio.run_coroutine_threadsafe(self.record_stage(job_id, stage), loop)
+
+        return callback
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+
+            try:
+                await self._run(job)
+
+            except Exception as e:
+                logger.error(f"Video job {job['job_id']} failed. Error: {e}")
+
+                try:
+                    await self._set_status(job["job_id"], "failed", error=str(e))
+                except Exception as status_error:
+                    # The job document stays in its last state, the worker must keep serving the queue
+                    logger.error(f"Failed to mark video job {job['job_id']} as failed. Error: {status_error}")
+
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job: dict):
+        job_id = job["job_id"]
+        request_id_var.set(job_id)
+
+        await self._set_status(job_id, "running")
+
+        async def on_stage(stage: str):
+            if stage in PIPELINE_STAGES:
+                await self.record_stage(job_id, PIPELINE_STAGES[stage])
+
+        # The file was ingested by the endpoint, the pipeline only looks it up in the verdict cache
+        context = AnalysisContext(
+            clerk_user_id=job["clerk_user_id"],
+            email=job["email"],
+            mime_type=job["mime_type"],
+            chat_id=job["chat_id"],
+            temp_file_path=job["temp_file_path"],
+            content_hash=job["content_hash"],
+            analyze_kwargs={"on_active": self._stage_callback(job_id, "gemini_active")},
+            on_stage=on_stage
+        )
+
+        await video_pipeline.run(context)
+        await self._set_status(job_id, "done", result=context.response())
+
+        logger.info(f"Video job {job_id} finished for chat_id: {context.chat_id}")
+
+    async def events(self, job_id: str):
+        """
+            Yields server-sent events for every stage of a job until it is done or failed.
+            Local jobs wake the stream immediately, jobs running in another
+            process are picked up by re-reading the job periodically.
+        """
+
+        wakeup = asyncio.Event()
+        self.subscribers.setdefault(job_id, set()).add(wakeup)
+        sent_stages = 0
+
+        try:
+            while True:
+                wakeup.clear()
+                job = await self.get(job_id)
+
+                if not job:
+                    yield _format_event("error", {"detail": "Job not found"})
+                    return
+
+                for stage in job["stages"][sent_stages:]:
+                    yield _format_event("stage", stage)
+
+                sent_stages = len(job["stages"])
+
+                if job["status"] == "done":
+                    yield _format_event("done", job["result"])
+                    return
+
+                if job["status"] == "failed":
+                    yield _format_event("failed", {"detail": job["error"]})
+                    return
+
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=Config.VIDEO_JOB_EVENT_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+
+        finally:
+            self.subscribers[job_id].discard(wakeup)
+
+            if not self.subscribers[job_id]:
+                del self.subscribers[job_id]
+
+def _format_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+video_jobs = VideoJobQueue(
+    collection_name="video_jobs",
+    max_size=Config.VIDEO_JOB_QUEUE_SIZE,
+    worker_count=Config.VIDEO_JOB_WORKERS
+)
@@ -0,0 +1,235 @@
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from typing import Awaitable, Callable, Dict, Optional
+import asyncio
+import os
+import random
+import socket
+
+from app.core.database import db
+from app.utils.logger import get_logger, request_id_var
+from app.utils.metrics import QUEUE_DEPTH, QUEUE_LAG_SECONDS
+
+logger = get_logger(__name__)
+
+class WorkQueue:
+    """
+        Durable work queue stored in a MongoDB collection.
+        Jobs are claimed with a lease, so a job whose worker died is picked up
+        again once the lease runs out. Failed jobs are retried with jittered
+        exponential backoff until max_attempts is reached.
+        The job id doubles as the idempotency key: enqueueing an id twice is a no-op.
+    """
+
+    def __init__(
+        self,
+        collection_name: str,
+        handlers: Dict[str, Callable[[dict], Awaitable[None]]],
+        worker_count: int,
+        lease_seconds: int,
+        max_attempts: int,
+        backoff_seconds: float,
+        max_backoff_seconds: float,
+        poll_seconds: float
+    ):
+        self.name = collection_name
+        self.collection = db[collection_name]
+        self.handlers = handlers
+        self.worker_count = worker_count
+        self.lease = timedelta(seconds=lease_seconds)
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.poll_seconds = poll_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.workers = []
+        self._wakeup = asyncio.Event()
+
+    async def enqueue(self, job_id: str, kind: str, payload: dict) -> bool:
+        """
+            Stores a job. Returns False if a job with this id was already enqueued.
+        """
+
+        now = datetime.now()
+
+        try:
+            await self.collection.insert_one({
+                "_id": job_id,
+                "kind": kind,
+                "payload": payload,
+                "status": "pending",
+                "attempts": 0,
+                "available_at": now,
+                "lease_until": None,
+                "leased_by": None,
+                "error": None,
+                "created_at": now,
+                "updated_at": now
+            })
+
+        except DuplicateKeyError:
+            logger.info(f"Job {job_id} was already enqueued, skipping")
+            return False
+
+        self._wakeup.set()
+        return True
+
+    async def start(self):
+        """
+            Starts the worker tasks. Called from the app lifespan.
+        """
+
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+        logger.info(f"Started {self.worker_count} workers for {self.collection.name}.")
+
+    async def stop(self):
+        """
+            Stops the workers. Jobs they were running are retried after their lease expires.
+        """
+
+        for worker in self.workers:
+            worker.cancel()
+
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def _claim(self) -> Optional[dict]:
+        now = datetime.now()
+
+        return await self.collection.find_one_and_update(
+            {
+                "$or": [
+                    {"status": "pending", "available_at": {"$lte": now}},
+                    {"status": "leased", "lease_until": {"$lt": now}}
+                ]
+            },
+            {
+                "$set": {"status": "leased", "lease_until": now + self.lease, "leased_by": self.worker_id, "updated_at": now},
+                "$inc": {"attempts": 1}
+            },
+            sort=[("available_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _extend_lease(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.lease.total_seconds() / 3)
+
+            try:
+                await self.collection.update_one(
+                    {"_id": job_id, "leased_by": self.worker_id},
+                    {"$set": {"lease_until": datetime.now() + self.lease}}
+                )
+            except Exception as e:
+                logger.warning(f"Failed to extend the lease of job {job_id}. Error: {e}")
+
+    async def _complete(self, job: dict):
+        now = datetime.now()
+
+        await self.collection.update_one(
+            {"_id": job["_id"], "leased_by": self.worker_id},
+            {"$set": {"status": "done", "completed_at": now, "updated_at": now, "error": None}}
+        )
+
+    async def _fail(self, job: dict, error: str):
+        now = datetime.now()
+
+        if job["attempts"] >= self.max_attempts:
+            update = {"status": "failed", "updated_at": now, "error": error}
+            logger.error(f"Job {job['_id']} failed for good after {job['attempts']} attempts. Error: {error}")
+        else:
+            backoff = min(self.backoff_seconds * 2 ** (job["attempts"] - 1), self.max_backoff_seconds)
+            backoff *= random.uniform(0.5, 1.5)
+            update = {"status": "pending", "available_at": now + timedelta(seconds=backoff), "updated_at": now, "error": error}
+            logger.warning(f"Job {job['_id']} failed on attempt {job['attempts']}, retrying in {backoff:.0f}s. Error: {error}")
+
+        await self.collection.update_one(
+            {"_id": job["_id"], "leased_by": self.worker_id},
+            {"$set": update}
+        )
+
+    async def _run(self, job: dict):
+        handler = self.handlers.get(job["kind"])
+        request_id_var.set(job["_id"])
+
+        if job["attempts"] > self.max_attempts:
+            await self._fail(job, job.get("error") or "Lease expired too many times")
+            return
+
+        if not handler:
+            await self._fail(job, f"No handler for job kind: {job['kind']}")
+            return
+
+        heartbeat = asyncio.create_task(self._extend_lease(job["_id"]))
+
+        try:
+            await handler(job["payload"])
+
+        except Exception as e:
+            await self._fail(job, str(e))
+            return
+
+        finally:
+            heartbeat.cancel()
+
+        await self._complete(job)
+        logger.info(f"Job {job['_id']} ({job['kind']}) done after {job['attempts']} attempts")
+
+    async def _worker(self):
+        while True:
+            try:
+                job = await self._claim()
+
+            except Exception as e:
+                logger.error(f"Failed to claim job from {self.collection.name}. Error: {e}")
+                job = None
+
+            if job:
+                try:
+                    await self._run(job)
+
+                except Exception as e:
+                    # The lease runs out and another worker retries the job, this one keeps going
+                    logger.error(f"Failed to run job {job['_id']} from {self.collection.name}. Error: {e}")
+
+                continue
+
+            # Sleep until the next poll, or until a job is enqueued by this process
+            self._wakeup.clear()
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def stats(self) -> dict:
+        """
+            Returns the queue depth per status and the lag of the oldest job that is ready to run.
+            Also updates the queue gauges, /metrics calls it on every scrape.
+        """
+
+        now = datetime.now()
+        counts = {"pending": 0, "leased": 0, "done": 0, "failed": 0}
+
+        async for row in self.collection.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+            counts[row["_id"]] = row["count"]
+
+        oldest = await self.collection.find_one(
+            {"status": "pending", "available_at": {"$lte": now}},
+            {"available_at": 1},
+            sort=[("available_at", 1)]
+        )
+
+        lag_seconds = (now - oldest["available_at"]).total_seconds() if oldest else 0.0
+
+        for status, count in counts.items():
+            QUEUE_DEPTH.labels(self.name, status).set(count)
+
+        QUEUE_LAG_SECONDS.labels(self.name).set(lag_seconds)
+
+        return {
+            "depth": counts["pending"] + counts["leased"],
+            **counts,
+            "lag_seconds": lag_seconds
+        }
@@ -0,0 +1,53 @@
+import hashlib
+
+from app.config import Config
+from app.core.database import db
+from app.core.work_queue import WorkQueue
+from app.crud.chat_messages import delete_chat_messages
+from app.crud.media_cleanup import clear_media_for_clerk_user, delete_orphaned_media
+from app.crud.response_cache import response_cache, user_tag, chat_tag
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+async def delete_clerk_user_data(payload: dict):
+    """
+        Deletes all media and chats associated with a deleted Clerk user.
+        Media goes first, so a failed run leaves the chats in place for the retry to find.
+    """
+
+    clerk_user_id = payload["clerk_user_id"]
+
+    await clear_media_for_clerk_user(clerk_user_id, strict=True)
+    emails = await db["chats"].distinct("user_email", { "clerk_user_id": clerk_user_id })
+    chat_ids = await delete_chat_messages({ "clerk_user_id": clerk_user_id })
+    result = await db["chats"].delete_many({ "clerk_user_id": clerk_user_id })
+
+    await response_cache.invalidate(*[user_tag(email) for email in emails], *[chat_tag(chat_id) for chat_id in chat_ids])
+
+    logger.info(f"Deleted {result.deleted_count} chats for Clerk user ID: {clerk_user_id}")
+
+deletion_queue = WorkQueue(
+    collection_name="deletion_jobs",
+    handlers={"user.deleted": delete_clerk_user_data, "media.orphaned": delete_orphaned_media},
+    worker_count=Config.DELETION_QUEUE_WORKERS,
+    lease_seconds=Config.DELETION_QUEUE_LEASE_SECONDS,
+    max_attempts=Config.DELETION_QUEUE_MAX_ATTEMPTS,
+    backoff_seconds=Config.DELETION_QUEUE_BACKOFF_SECONDS,
+    max_backoff_seconds=Config.DELETION_QUEUE_MAX_BACKOFF_SECONDS,
+    poll_seconds=Config.DELETION_QUEUE_POLL_SECONDS
+)
+
+async def queue_orphaned_media(media_urls: list, media_type: str):
+    """
+        Queues the deletion of media uploaded for an analysis that failed, so no chat references it.
+        Errors are logged, the caller is already handling the failure of the analysis.
+    """
+
+    for media_url in media_urls:
+        job_id = f"orphan:{hashlib.sha256(media_url.encode()).hexdigest()}"
+
+        try:
+            await deletion_queue.enqueue(job_id, "media.orphaned", {"media_url": media_url, "media_type": media_type})
+        except Exception as e:
+            logger.error(f"Failed to queue the deletion of orphaned media {media_url}. Error: {e}")
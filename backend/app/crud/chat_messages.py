@@ -0,0 +1,234 @@
+from bson import ObjectId
+from datetime import datetime
+from pymongo.errors import BulkWriteError
+from typing import Optional
+import uuid
+
+from app.config import Config
+from app.core.database import db
+from app.crud.response_cache import response_cache, user_tag, chat_tag
+
+MESSAGES_COLLECTION = "messages"
+
+def build_messages(media_type: str, document_url: str, label: str, confidence: float, reason: str) -> tuple:
+    """
+        Builds the (user_message, ai_message) pair stored for one analysis.
+    """
+
+    user_message = {
+        "id": str(uuid.uuid4()),
+        "role": "user",
+        "type": media_type,
+        "content": document_url,
+        "created_at": datetime.now()
+    }
+
+    ai_message = {
+        "id": str(uuid.uuid4()),
+        "role": "aidentify",
+        "type": media_type,
+        "content": document_url,
+        "label": label,
+        "confidence": confidence,
+        "reason": reason,
+        "created_at": datetime.now()
+    }
+
+    return user_message, ai_message
+
+def build_summary(messages: list) -> dict:
+    """
+        Summary fields kept on the chat document, so the sidebar never reads messages.
+    """
+
+    summary = {"last_message_at": messages[-1]["created_at"]}
+    labels = [message["label"] for message in messages if message.get("label")]
+
+    if labels:
+        summary["last_label"] = labels[-1]
+
+    return summary
+
+def to_documents(chat_id: ObjectId, messages: list) -> list:
+    # Copies, insert_many would add an ObjectId _id to the messages returned to the client
+    return [{**message, "chat_id": chat_id} for message in messages]
+
+async def save_messages(chat_id: str, clerk_user_id: str, email: str, media_type: str, messages: list):
+    """
+        Appends messages to an existing chat, or creates a new chat when no chat_id is given.
+        With MESSAGE_STORE=collection the messages go to the messages collection and
+        the chat only keeps the summary fields (message_count, last_label, last_message_at).
+        Returns (chat_id, result of the Mongo write).
+    """
+
+    in_collection = Config.MESSAGE_STORE == "collection"
+    summary = build_summary(messages)
+
+    if not chat_id or chat_id == "null" or chat_id == "":
+        new_chat = {
+            "_id": ObjectId(),
+            "clerk_user_id": clerk_user_id,
+            "user_email": email,
+            "title": f"{media_type.capitalize()} Analysis {datetime.now().strftime('%H:%M')}",
+            "created_at": datetime.now(),
+            **summary
+        }
+
+        if in_collection:
+            # Messages first: if the chat insert fails they are unreachable instead of missing
+            await db[MESSAGES_COLLECTION].insert_many(to_documents(new_chat["_id"], messages))
+            new_chat["message_count"] = len(messages)
+        else:
+            new_chat["messages"] = messages
+
+        result = await db["chats"].insert_one(new_chat)
+        await response_cache.invalidate(user_tag(email))
+
+        return str(result.inserted_id), result
+
+    if in_collection:
+        await db[MESSAGES_COLLECTION].insert_many(to_documents(ObjectId(chat_id), messages))
+        update = {"$set": summary, "$inc": {"message_count": len(messages)}}
+    else:
+        update = {"$set": summary, "$push": {"messages": {"$each": messages}}}
+
+    result = await db["chats"].update_one({"_id": ObjectId(chat_id)}, update)
+    await response_cache.invalidate(user_tag(email), chat_tag(chat_id))
+
+    return chat_id, result
+
+def _strip(document: dict) -> dict:
+    document.pop("_id", None)
+    document.pop("chat_id", None)
+    return document
+
+async def read_messages(chat: dict, before: Optional[tuple] = None, limit: Optional[int] = None) -> tuple:
+    """
+        Returns (messages, next_key) for a chat document, oldest message first.
+
+        Messages in the messages collection are read a page at a time: the `limit` newest
+        messages older than `before`, a (created_at, _id) key. next_key is the key of the
+        oldest returned message when older ones exist, else None.
+        Chats that still hold embedded messages (written in embedded mode, or not migrated yet)
+        are returned in full, as before.
+    """
+
+    embedded = chat.get("messages") or []
+
+    if "message_count" not in chat:
+        return embedded, None
+
+    query = {"chat_id": chat["_id"]}
+
+    if embedded:
+        # A chat caught mid-migration may hold a message in both places
+        stored = await db[MESSAGES_COLLECTION].find(query).to_list(length=None)
+        embedded_ids = {message["id"] for message in embedded}
+        messages = embedded + [_strip(message) for message in stored if message["id"] not in embedded_ids]
+        messages.sort(key=lambda message: message["created_at"])
+        return messages, None
+
+    limit = max(1, min(limit or Config.MESSAGE_PAGE_SIZE, Config.MESSAGE_MAX_PAGE_SIZE))
+
+    if before:
+        created_at, message_id = before
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": message_id}}
+        ]
+
+    # Fetch one extra message to know whether an older page exists
+    page = await db[MESSAGES_COLLECTION].find(query).sort(
+        [("created_at", -1), ("_id", -1)]
+    ).limit(limit + 1).to_list(length=limit + 1)
+
+    has_more = len(page) > limit
+    page = page[:limit]
+    next_key = (page[-1]["created_at"], page[-1]["_id"]) if has_more else None
+
+    return [_strip(message) for message in reversed(page)], next_key
+
+async def attach_all_messages(chats: list) -> list:
+    """
+        Sets the full message list, oldest first, on each of the chat documents,
+        for responses that still return every chat with all of its messages.
+        The messages of all chats stored in the messages collection are read with one query.
+    """
+
+    chat_ids = [chat["_id"] for chat in chats if "message_count" in chat]
+    stored = {}
+
+    if chat_ids:
+        cursor = db[MESSAGES_COLLECTION].find({"chat_id": {"$in": chat_ids}}).sort([("created_at", 1), ("_id", 1)])
+
+        async for message in cursor:
+            stored.setdefault(message["chat_id"], []).append(_strip(message))
+
+    for chat in chats:
+        embedded = chat.get("messages") or []
+        messages = stored.get(chat["_id"])
+
+        if not messages:
+            chat["messages"] = embedded
+            continue
+
+        if embedded:
+            # A chat caught mid-migration may hold a message in both places
+            embedded_ids = {message["id"] for message in embedded}
+            messages = embedded + [message for message in messages if message["id"] not in embedded_ids]
+            messages.sort(key=lambda message: message["created_at"])
+
+        chat["messages"] = messages
+
+    return chats
+
+async def delete_chat_messages(query: dict) -> list:
+    """
+        Deletes the messages collection entries of the chats matching the query.
+        Call before deleting the chats themselves. Returns the ids of the chats.
+    """
+
+    chat_ids = await db["chats"].distinct("_id", query)
+
+    if chat_ids:
+        await db[MESSAGES_COLLECTION].delete_many({"chat_id": {"$in": chat_ids}})
+
+    return chat_ids
+
+async def migrate_chat(chat: dict) -> bool:
+    """
+        Moves the embedded messages of one chat to the messages collection.
+        Safe to run while the app serves traffic and to run again: messages already copied
+        are skipped, (chat_id, id) is unique, and the array is only removed if no message was pushed meanwhile.
+        Returns False when the chat changed under the migration and has to be retried.
+    """
+
+    messages = chat.get("messages") or []
+    copied = set(await db[MESSAGES_COLLECTION].distinct("id", {"chat_id": chat["_id"]})) if messages else set()
+    documents = [document for document in to_documents(chat["_id"], messages) if document["id"] not in copied]
+
+    if documents:
+        try:
+            await db[MESSAGES_COLLECTION].insert_many(documents, ordered=False)
+
+        except BulkWriteError as e:
+            # Another run copied some of them first, the unique index kept a single copy
+            if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                raise
+
+    result = await db["chats"].update_one(
+        {"_id": chat["_id"], "messages": {"$size": len(messages)}},
+        {"$inc": {"message_count": len(messages)}, "$unset": {"messages": ""}}
+    )
+
+    if result.modified_count != 1:
+        return False
+
+    if messages:
+        # Only chats never written in collection mode lack a summary, later messages would be newer
+        await db["chats"].update_one(
+            {"_id": chat["_id"], "last_message_at": {"$exists": False}},
+            {"$set": build_summary(messages)}
+        )
+
+    return True
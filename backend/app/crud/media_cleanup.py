@@ -1,9 +1,20 @@
 from bson import ObjectId
+import asyncio
 import re
 
-from app.core.cloudinary_client import delete_resource
+from app.config import Config
+from app.core.cloudinary_client import CLOUDINARY_DELETE_BATCH_SIZE, delete_resources
 from app.core.database import db
-from app.utils.logger import logger
+from app.core.executors import run_upload
+from app.crud.chat_messages import MESSAGES_COLLECTION
+from app.crud.verdict_cache import verdict_cache
+from app.utils.gemini_files import file_registry
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Calls per batch of public ids, ids Cloudinary failed to delete are sent again
+CLOUDINARY_DELETE_ATTEMPTS = 2
 
 def extract_public_id_from_url(url: str) -> str:
     """
@@ -20,52 +31,184 @@ def extract_public_id_from_url(url: str) -> str:
     
     return None
 
-async def delete_media_for_chat_id(chat_id: str):
+async def collect_media(query: dict) -> tuple:
+    """
+        Reads the chats matching the query with one projected query, and the messages
+        of those chats that live in the messages collection with another.
+        Returns (chat_ids, {media_url: resource_type}) for every media uploaded by the user.
+    """
+
+    chats = await db["chats"].find(
+        query,
+        { "messages.role": 1, "messages.type": 1, "messages.content": 1 }
+    ).to_list(length=None)
+
+    chat_ids = [chat["_id"] for chat in chats]
+    messages = [message for chat in chats for message in chat.get("messages", []) if message["role"] == "user"]
+
+    if chat_ids:
+        messages += await db[MESSAGES_COLLECTION].find(
+            { "chat_id": { "$in": chat_ids }, "role": "user" },
+            { "_id": 0, "type": 1, "content": 1 }
+        ).to_list(length=None)
+
+    media = {}
+
+    for message in messages:
+        # Cloudinary uses resource_type "video" for audio files as well
+        media[message["content"]] = "image" if message["type"] == "image" else "video"
+
+    return chat_ids, media
+
+async def delete_public_ids(public_ids: list, resource_type: str) -> list:
+    """
+        Deletes up to 100 public ids with one call, sending the ids that failed again.
+        Cloudinary reports the outcome per id in `deleted`, "not_found" means the asset is gone already.
+        Returns the public ids that are still not deleted.
+    """
+
+    failed = public_ids
+
+    for _ in range(CLOUDINARY_DELETE_ATTEMPTS):
+        response = await run_upload(delete_resources, failed, resource_type)
+        deleted = (response or {}).get("deleted", {})
+        failed = [public_id for public_id in failed if deleted.get(public_id) not in ("deleted", "not_found")]
+
+        if not failed:
+            break
+
+    return failed
+
+async def find_shared_media(media_urls: list, excluded_chat_ids: list) -> set:
     """
-        Deletes all media which was used in a specific chat.
+        Returns the media URLs that are still used by chats that are not being deleted.
+        The verdict cache hands the same Cloudinary URL to every upload of identical media,
+        so one URL can appear in many chats.
+    """
+
+    if not media_urls:
+        return set()
+
+    used_urls = await db["chats"].distinct(
+        "messages.content",
+        { "_id": { "$nin": excluded_chat_ids }, "messages.content": { "$in": media_urls } }
+    )
+
+    used_urls += await db[MESSAGES_COLLECTION].distinct(
+        "content",
+        { "content": { "$in": media_urls }, "chat_id": { "$nin": excluded_chat_ids } }
+    )
+
+    return set(used_urls) & set(media_urls)
+
+async def delete_media_for_chats(query: dict, strict: bool = False):
+    """
+        Deletes all media used in the chats matching the query.
+        Public ids are grouped by resource type and deleted with Cloudinary's bulk API,
+        up to 100 per call, with a bounded number of calls in flight.
+        With `strict`, failures are raised instead of logged, so a queued job can retry.
     """
 
     try:
-        chat = await db["chats"].find_one({ "_id": ObjectId(chat_id) })
+        chat_ids, media = await collect_media(query)
+        shared_urls = await find_shared_media(list(media), chat_ids)
 
-        if not chat:
-            logger.error(f"Chat with chat_id: {chat_id} not found for media cleanup")
-            return
-        
-        messages = chat.get("messages", [])
+        if shared_urls:
+            logger.info(f"Skipping deletion of {len(shared_urls)} shared media")
 
-        for message in messages:
-            if message["role"] == "user":
-                media_url = message["content"]
-                media_type = message["type"]
+        public_ids = { "image": [], "video": [] }
+        deleted_urls = []
 
-                if media_type == "audio":
-                    media_type = "video" # Cloudinary uses resource_type "video" for audio files as well
+        for media_url, resource_type in media.items():
+            public_id = extract_public_id_from_url(media_url)
 
-                public_id = extract_public_id_from_url(media_url)
+            if public_id and media_url not in shared_urls:
+                public_ids[resource_type].append(public_id)
+                deleted_urls.append(media_url)
 
-                if public_id:
-                    await delete_resource(public_id, media_type)
+        file_keys = await verdict_cache.invalidate_urls(deleted_urls)
 
-        return
+        # Uploads kept on Gemini for a re-analysis of this media go with it
+        for file_key in file_keys:
+            file_registry.evict(file_key)
+
+        semaphore = asyncio.Semaphore(Config.MEDIA_DELETE_CONCURRENCY)
+
+        async def delete_batch(batch: list, resource_type: str) -> list:
+            async with semaphore:
+                return await delete_public_ids(batch, resource_type)
+
+        results = await asyncio.gather(*[
+            delete_batch(ids[start:start + CLOUDINARY_DELETE_BATCH_SIZE], resource_type)
+            for resource_type, ids in public_ids.items()
+            for start in range(0, len(ids), CLOUDINARY_DELETE_BATCH_SIZE)
+        ])
+
+        failed_ids = [public_id for failed in results for public_id in failed]
+
+        if failed_ids:
+            message = f"Failed to delete {len(failed_ids)} media from Cloudinary: {', '.join(failed_ids)}"
+
+            if strict:
+                raise RuntimeError(message)
+
+            logger.error(message)
+
+        logger.info(f"Deleted {len(deleted_urls) - len(failed_ids)} media from {len(chat_ids)} chats")
 
     except Exception as e:
-        logger.error(f"Failed to delete media for chat_id: {chat_id}. Error: {e}")
+        logger.error(f"Failed to delete media for chats matching {query}. Error: {e}")
+
+        if strict:
+            raise
+
+async def delete_orphaned_media(payload: dict):
+    """
+        Deletes media uploaded to Cloudinary for an analysis that failed before it was saved,
+        unless a chat references it by now. Raises on failure, so the queued job is retried.
+    """
+
+    media_url = payload["media_url"]
+    public_id = extract_public_id_from_url(media_url)
+
+    if not public_id:
         return
 
+    # A failed save may have cached the verdict first, drop it so no new chat picks the URL up
+    file_keys = await verdict_cache.invalidate_urls([media_url])
+
+    for file_key in file_keys:
+        file_registry.evict(file_key)
+
+    if await find_shared_media([media_url], []):
+        logger.info(f"Orphaned media {media_url} is used by a chat, keeping it")
+        return
+
+    # Cloudinary uses resource_type "video" for audio files as well
+    resource_type = "image" if payload["media_type"] == "image" else "video"
+
+    if await delete_public_ids([public_id], resource_type):
+        raise RuntimeError(f"Failed to delete orphaned media {public_id}")
+
+    logger.info(f"Deleted orphaned media {public_id}")
+
+async def delete_media_for_chat_id(chat_id: str, email: str):
+    """
+        Deletes all media which was used in a specific chat of the user.
+    """
+
+    await delete_media_for_chats({ "_id": ObjectId(chat_id), "user_email": email })
+
 async def clear_media_for_user(email: str):
     """
         Deletes all media which is associated with a specific user.
     """
 
-    try:
-        chats = await db["chats"].find({ "user_email": email }).to_list(length=None)
+    await delete_media_for_chats({ "user_email": email })
 
-        for chat in chats:
-            await delete_media_for_chat_id(str(chat["_id"]))
-        
-        return
-    
-    except Exception as e:
-        logger.error(f"Failed to clear media for user: {email}. Error: {e}")
-        return
+async def clear_media_for_clerk_user(clerk_user_id: str, strict: bool = False):
+    """
+        Deletes all media which is associated with a specific Clerk user.
+    """
+
+    await delete_media_for_chats({ "clerk_user_id": clerk_user_id }, strict)
@@ -0,0 +1,214 @@
+from bson import ObjectId
+from collections import OrderedDict
+from datetime import datetime
+from fastapi import Request, Response
+from pymongo import UpdateOne
+from typing import Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple
+import hashlib
+import time
+
+from app.config import Config
+from app.core.database import db
+from app.utils.logger import get_logger
+from app.utils.metrics import RESPONSE_CACHE_BYTES, RESPONSE_CACHE_REQUESTS, sample_gauge
+
+logger = get_logger(__name__)
+
+def user_tag(email: str) -> str:
+    return f"user:{email}"
+
+def chat_tag(chat_id) -> str:
+    return f"chat:{chat_id}"
+
+class MemoryGenerationStore:
+    """
+        Tag generations kept in this process. Invalidations only reach this worker.
+    """
+
+    def __init__(self, max_tags: int = 100_000):
+        self.max_tags = max_tags
+        self._generations: Dict[str, int] = {}
+        self._invalidations = 0
+
+    async def get(self, tags: Iterable[str]) -> tuple:
+        return tuple(self._generations.get(tag) for tag in tags)
+
+    async def bump(self, tags: Iterable[str]):
+        self._invalidations += 1
+
+        for tag in tags:
+            # A fresh number, never equal to a generation read before, even after the dict was cleared
+            self._generations[tag] = self._invalidations
+
+        # A cleared tag reads as None, which only turns the entries it was cached with into misses
+        if len(self._generations) > self.max_tags:
+            self._generations.clear()
+
+class MongoGenerationStore:
+    """
+        Tag generations shared by every worker, stored in a MongoDB collection.
+        A generation is a fresh ObjectId per invalidation, so it never repeats.
+    """
+
+    def __init__(self, collection_name: str):
+        self.collection = db[collection_name]
+
+    async def get(self, tags: Iterable[str]) -> tuple:
+        tags = tuple(tags)
+        documents = await self.collection.find({"_id": {"$in": list(tags)}}).to_list(length=None)
+        generations = {document["_id"]: document["generation"] for document in documents}
+        return tuple(generations.get(tag) for tag in tags)
+
+    async def bump(self, tags: Iterable[str]):
+        now = datetime.now()
+        updates = [UpdateOne({"_id": tag}, {"$set": {"generation": ObjectId(), "updated_at": now}}, upsert=True) for tag in tags]
+
+        if updates:
+            await self.collection.bulk_write(updates, ordered=False)
+
+class ResponseCache:
+    """
+        In-process LRU of serialized JSON responses for the chat read endpoints.
+        Eviction is by total body size, not entry count, so a few huge histories
+        cannot push out thousands of small chats.
+        Entries carry tags (user:<email>, chat:<chat_id>) and writes invalidate
+        every entry with a tag. Each entry keeps the generations of its tags, read from
+        `store` before the body was rendered, and every hit compares them with the
+        current ones. With the MongoDB store a write on one worker is seen by all of them.
+    """
+
+    def __init__(self, store, max_bytes: int, max_entry_bytes: int, ttl_seconds: float):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.ttl_seconds = ttl_seconds
+        self.size = 0
+        self._entries = OrderedDict()
+        self._tagged: Dict[str, set] = {}
+
+        sample_gauge(RESPONSE_CACHE_BYTES, lambda: self.size)
+
+    async def get(self, key: Hashable) -> Optional[dict]:
+        entry = self._entries.get(key)
+
+        if entry is None:
+            return None
+
+        if entry["expires_at"] <= time.monotonic() or await self.store.get(entry["tags"]) != entry["generations"]:
+            # The key may have been cached again while the generations were read
+            if self._entries.get(key) is entry:
+                self._drop(key)
+            return None
+
+        if key in self._entries:
+            self._entries.move_to_end(key)
+
+        return entry
+
+    async def snapshot(self, tags: Iterable[str]) -> tuple:
+        """
+            Generations of the tags, taken before reading the data to cache.
+        """
+
+        return await self.store.get(tags)
+
+    def set(self, key: Hashable, body: bytes, tags: Tuple[str, ...], snapshot: tuple) -> dict:
+        """
+            Stores a response body and returns its entry.
+            The entry is stale once a tag was invalidated since `snapshot`, the body may predate that write.
+        """
+
+        entry = {
+            "body": body,
+            "etag": f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"',
+            "tags": tags,
+            "generations": snapshot,
+            "expires_at": time.monotonic() + self.ttl_seconds
+        }
+
+        if len(body) > self.max_entry_bytes:
+            return entry
+
+        self._drop(key)
+        self._entries[key] = entry
+        self.size += len(body)
+
+        for tag in tags:
+            self._tagged.setdefault(tag, set()).add(key)
+
+        while self.size > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+
+        return entry
+
+    def _drop(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+
+        if entry is None:
+            return
+
+        self.size -= len(entry["body"])
+
+        for tag in entry["tags"]:
+            keys = self._tagged.get(tag)
+
+            if keys:
+                keys.discard(key)
+
+                if not keys:
+                    del self._tagged[tag]
+
+    async def invalidate(self, *tags: str):
+        """
+            Drops every entry carrying one of the tags, here and, with a shared store, on every worker.
+        """
+
+        for tag in tags:
+            for key in list(self._tagged.get(tag, ())):
+                self._drop(key)
+
+        try:
+            await self.store.bump(tags)
+        except Exception as e:
+            # The write itself succeeded, other workers serve the old response until it expires
+            logger.error(f"Failed to invalidate cached responses of {', '.join(tags)}. Error: {e}")
+
+    async def serve(self, request: Request, key: Hashable, tags: Tuple[str, ...], render: Callable[[], Awaitable[Optional[bytes]]]) -> Response:
+        """
+            Responds from the cache, or renders the JSON body and caches it under the tags.
+            A None body is sent as null and not cached.
+            Answers 304 when If-None-Match names the current ETag.
+        """
+
+        entry = await self.get(key)
+
+        if entry is None:
+            snapshot = await self.snapshot(tags)
+            body = await render()
+
+            if body is None:
+                return Response(b"null", media_type="application/json")
+
+            entry = self.set(key, body, tags, snapshot)
+            RESPONSE_CACHE_REQUESTS.labels("miss").inc()
+        else:
+            RESPONSE_CACHE_REQUESTS.labels("hit").inc()
+
+        headers = {"ETag": entry["etag"], "Cache-Control": "private, no-cache"}
+        if_none_match = [etag.strip().removeprefix("W/") for etag in request.headers.get("if-none-match", "").split(",")]
+
+        if entry["etag"] in if_none_match or "*" in if_none_match:
+            RESPONSE_CACHE_REQUESTS.labels("not_modified").inc()
+            return Response(status_code=304, headers=headers)
+
+        return Response(entry["body"], media_type="application/json", headers=headers)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "bytes": self.size, "max_bytes": self.max_bytes}
+
+response_cache = ResponseCache(
+    store=MongoGenerationStore("cache_generations") if Config.RESPONSE_CACHE_STORE == "mongo" else MemoryGenerationStore(),
+    max_bytes=Config.RESPONSE_CACHE_MAX_BYTES,
+    max_entry_bytes=Config.RESPONSE_CACHE_MAX_ENTRY_BYTES,
+    ttl_seconds=Config.RESPONSE_CACHE_TTL_SECONDS
+)
@@ -0,0 +1,131 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app.config import Config
+from app.core.database import db
+from app.utils.llm_analysis import ANALYSIS_VERSION
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+def build_cache_key(content_hash: str, media_type: str) -> str:
+    """
+        Builds the cache key for a media file.
+        The analysis version is part of the key, so changing the prompt or model
+        never serves verdicts produced by the old one.
+    """
+
+    return f"{media_type}:{ANALYSIS_VERSION}:{content_hash}"
+
+class VerdictCache:
+    """
+        Two tier cache of LLM verdicts.
+        An in-process LRU sits in front of a MongoDB collection whose entries
+        are evicted by a TTL index (see app/core/indexes.py).
+    """
+
+    def __init__(self, collection_name: str, max_entries: int, ttl_seconds: int):
+        self.collection = db[collection_name]
+        self.max_entries = max_entries
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self._entries = OrderedDict()
+
+    def _remember(self, key: str, entry: dict):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[dict]:
+        """
+            Returns the cached verdict for the key, or None on a miss.
+        """
+
+        now = datetime.now()
+        entry = self._entries.get(key)
+
+        if entry:
+            if entry["expires_at"] > now:
+                self._entries.move_to_end(key)
+                return entry
+
+            del self._entries[key]
+
+        try:
+            entry = await self.collection.find_one(
+                {"_id": key, "expires_at": {"$gt": now}},
+                {"_id": 0, "label": 1, "confidence": 1, "reason": 1, "document_url": 1, "expires_at": 1}
+            )
+        except Exception as e:
+            logger.error(f"Failed to read verdict cache for key: {key}. Error: {e}")
+            return None
+
+        if entry:
+            self._remember(key, entry)
+
+        return entry
+
+    async def set(self, key: str, document_url: str, label: str, confidence: float, reason: str, file_key: Optional[str] = None):
+        """
+            Stores a verdict together with the Cloudinary URL of the media,
+            and its file registry key (see build_file_key) for when the media is deleted.
+            Failed analyses ("Unknown" label) are never cached.
+        """
+
+        if label not in ("AI", "Real"):
+            return
+
+        now = datetime.now()
+        entry = {
+            "label": label,
+            "confidence": confidence,
+            "reason": reason,
+            "document_url": document_url,
+            "file_key": file_key,
+            "expires_at": now + self.ttl
+        }
+
+        self._remember(key, entry)
+
+        try:
+            await self.collection.update_one(
+                {"_id": key},
+                {"$set": {**entry, "created_at": now}},
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Failed to write verdict cache for key: {key}. Error: {e}")
+
+    async def invalidate_urls(self, document_urls: list) -> set:
+        """
+            Drops every cached verdict that points at one of the given Cloudinary URLs.
+            Called when media is deleted, so a cache hit never returns a dead URL.
+            Returns the file registry keys of the dropped verdicts.
+        """
+
+        if not document_urls:
+            return set()
+
+        urls = set(document_urls)
+        file_keys = set()
+
+        for key in [k for k, entry in self._entries.items() if entry["document_url"] in urls]:
+            file_keys.add(self._entries.pop(key).get("file_key"))
+
+        try:
+            query = {"document_url": {"$in": list(urls)}}
+            file_keys.update(await self.collection.distinct("file_key", query))
+            await self.collection.delete_many(query)
+        except Exception as e:
+            logger.error(f"Failed to invalidate verdict cache entries. Error: {e}")
+
+        file_keys.discard(None)
+        return file_keys
+
+verdict_cache = VerdictCache(
+    collection_name="verdict_cache",
+    max_entries=Config.VERDICT_CACHE_SIZE,
+    ttl_seconds=Config.VERDICT_CACHE_TTL_SECONDS
+)
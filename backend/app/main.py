@@ -1,14 +1,58 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+import asyncio
+import gc
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.config import Config
+from app.core.executors import shutdown_executors
+from app.core.indexes import ensure_indexes
+from app.core.pipeline import MAX_FILE_SIZE
+from app.core.video_jobs import video_jobs
+from app.crud.account_deletion import deletion_queue
+from app.utils.gemini_files import file_registry
+from app.utils.ingest import MULTIPART_OVERHEAD, UploadLimitMiddleware
+from app.utils.logger import RequestIdMiddleware, get_logger
+from app.utils.memory import MemoryMiddleware
+from app.utils.metrics import MULTIPROCESS, MetricsMiddleware, mark_worker_dead, render_metrics, sample_gauges_forever
+from app.utils.temp_files import remove_leftover_temp_files
 from app.api.image_route import router as image_router
 from app.api.video_route import router as video_router
 from app.api.audio_route import router as audio_router
 from app.api.chat_route import router as chat_router
 from app.api.webhook_route import router as webhook_router
+from app.api.system_route import router as system_router
 
-app = FastAPI(title="AIdentify Backend")
+logger = get_logger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await ensure_indexes()
+    await video_jobs.start()
+    await deletion_queue.start()
+
+    # With several workers every worker writes its live gauges for /metrics to aggregate
+    sampler = asyncio.create_task(sample_gauges_forever(Config.METRICS_SAMPLE_SECONDS)) if MULTIPROCESS else None
+
+    # Objects created at import time live for the whole process,
+    # keep them out of every later garbage collection
+    gc.freeze()
+
+    yield
+
+    # Uvicorn has already drained the in-flight requests, now finish the background work
+    await video_jobs.stop(drain_seconds=Config.SHUTDOWN_DRAIN_SECONDS)
+    await deletion_queue.stop()
+    shutdown_executors()
+    file_registry.close()
+    remove_leftover_temp_files()
+
+    if sampler:
+        sampler.cancel()
+
+    mark_worker_dead()
+
+app = FastAPI(title="AIdentify Backend", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,11 +62,35 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request body caps of the upload endpoints, enforced before the multipart parser writes anything to disk
+app.add_middleware(UploadLimitMiddleware, limits={
+    "/api/image/analyze": MAX_FILE_SIZE + MULTIPART_OVERHEAD,
+    "/api/video/analyze": MAX_FILE_SIZE + MULTIPART_OVERHEAD,
+    "/api/video/jobs": MAX_FILE_SIZE + MULTIPART_OVERHEAD,
+    "/api/audio/analyze": MAX_FILE_SIZE + MULTIPART_OVERHEAD,
+    "/api/image/analyze_batch": Config.BATCH_MAX_BODY_MB * 1024 * 1024
+})
+app.add_middleware(MemoryMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestIdMiddleware)
+
 app.include_router(image_router, prefix="/api/image", tags=["Image Analysis"])
 app.include_router(video_router, prefix="/api/video", tags=["Video Analysis"])
 app.include_router(audio_router, prefix="/api/audio", tags=["Audio Analysis"])
 app.include_router(chat_router, prefix="/api/chat", tags=["Chat History"])
 app.include_router(webhook_router, prefix="/api/webhook", tags=["Webhooks"])
+app.include_router(system_router, prefix="/api/system", tags=["System"])
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    # The deletion queue lives in MongoDB, its gauges are refreshed on every scrape.
+    # Without MongoDB they keep their last values, the other metrics matter most then.
+    try:
+        await asyncio.wait_for(deletion_queue.stats(), timeout=Config.METRICS_QUEUE_STATS_TIMEOUT_SECONDS)
+    except Exception as e:
+        logger.error(f"Failed to refresh the deletion queue gauges. Error: {e!r}")
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
 
 @app.get("/")
 def root():
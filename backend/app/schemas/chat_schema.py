@@ -18,6 +18,23 @@ class ChatSchema(BaseModel):
     title: str
     created_at: datetime = Field(default_factory=datetime.now)
     messages: List[MessageSchema] = []
+    message_count: Optional[int] = None   # Set once the messages live in the messages collection
+    last_label: Optional[str] = None
+    next_cursor: Optional[str] = None     # Older messages, see /api/chat/{chat_id}/messages
+
+class MessagePageSchema(BaseModel):
+    messages: List[MessageSchema] = []
+    next_cursor: Optional[str] = None   # Pass as `cursor` to get older messages, None on the first page of the chat
 
 class ChatCreate(BaseModel):
     email: str
+
+class ChatSummarySchema(BaseModel):
+    id: str = Field(..., alias="_id")
+    title: str
+    created_at: datetime
+    last_label: Optional[str] = None    # Label of the latest verdict in the chat
+
+class ChatHistoryPageSchema(BaseModel):
+    chats: List[ChatSummarySchema] = []
+    next_cursor: Optional[str] = None   # Pass as `cursor` to get the next page, None on the last page
@@ -0,0 +1,23 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import datetime
+
+class JobStageSchema(BaseModel):
+    stage: str      # [received, uploaded, gemini_active, analyzed, persisted]
+    at: datetime
+
+class VideoJobSchema(BaseModel):
+    id: str = Field(..., alias="_id")
+    status: str     # [queued, running, done, failed]
+    stage: str
+    stages: List[JobStageSchema] = []
+    chat_id: Optional[str] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+class VideoJobSubmitted(BaseModel):
+    job_id: str
+    status_url: str
+    events_url: str
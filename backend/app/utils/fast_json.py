@@ -0,0 +1,82 @@
+from bson import ObjectId
+from pydantic import BaseModel
+from pydantic_core import PydanticUndefined
+from typing import List, Optional, Type, get_args, get_origin
+import orjson
+
+class Shape:
+    """
+        The output layout of a response model, compiled once: for every field the
+        output key (the alias), the document key to read, its default and the shape
+        of nested models. Applying it to a Mongo document keeps exactly the fields
+        the model would output, without validating or building model instances.
+    """
+
+    def __init__(self, model: Type[BaseModel]):
+        self.fields = []
+
+        for name, field in model.model_fields.items():
+            key = field.alias or name
+            nested, is_list = self._nested(field.annotation)
+
+            if field.default_factory is not None:
+                default = field.default_factory
+            elif field.default is PydanticUndefined:
+                default = None
+            else:
+                default = (lambda value: lambda: value)(field.default)
+
+            self.fields.append((key, default, nested, is_list))
+
+    @staticmethod
+    def _nested(annotation) -> tuple:
+        # Unwraps Optional[...] and List[...] down to a model class
+        is_list = False
+
+        while get_origin(annotation) is not None:
+            if get_origin(annotation) in (list, List):
+                is_list = True
+
+            arguments = [argument for argument in get_args(annotation) if argument is not type(None)]
+            annotation = arguments[0] if arguments else None
+
+        if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            return Shape(annotation), is_list
+
+        return None, is_list
+
+    def apply(self, document: dict) -> dict:
+        output = {}
+
+        for key, default, nested, is_list in self.fields:
+            if key in document:
+                value = document[key]
+            elif default is not None:
+                value = default()
+            else:
+                continue
+
+            if nested and value is not None:
+                value = [nested.apply(item) for item in value] if is_list else nested.apply(value)
+
+            output[key] = value
+
+        return output
+
+def _encode(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def dumps(shape: Optional[Shape], content, many: bool = False) -> bytes:
+    """
+        Serializes BSON documents straight to JSON bytes with orjson.
+        ObjectId becomes its hex string, datetime ISO 8601 as pydantic writes it.
+        With a shape the documents are first cut down to the response model's fields.
+    """
+
+    if shape:
+        content = [shape.apply(document) for document in content] if many else shape.apply(content)
+
+    return orjson.dumps(content, default=_encode, option=orjson.OPT_UTC_Z)
@@ -0,0 +1,297 @@
+from contextvars import ContextVar
+from google.api_core import exceptions as api_exceptions
+from typing import Optional
+import google.generativeai as genai
+import random
+import threading
+import time
+
+from app.config import Config
+from app.utils.logger import get_logger
+from app.utils.metrics import GEMINI_BREAKER_STATE, GEMINI_BUDGET_AVAILABLE, GEMINI_CALLS, GEMINI_RETRIES, GEMINI_THROTTLE_SECONDS, sample_gauge
+
+logger = get_logger(__name__)
+
+# HTTP statuses worth retrying: rate limits and upstream failures
+TRANSIENT_STATUSES = {408, 429, 500, 502, 503, 504}
+
+TRANSIENT_EXCEPTIONS = (
+    api_exceptions.TooManyRequests,
+    api_exceptions.ResourceExhausted,
+    api_exceptions.InternalServerError,
+    api_exceptions.BadGateway,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.GatewayTimeout,
+    api_exceptions.DeadlineExceeded,
+    ConnectionError,
+    TimeoutError
+)
+
+class GeminiUnavailable(Exception):
+    """
+        Raised instead of calling Gemini when the circuit breaker is open or the
+        request budget stays exhausted, and after transient errors outlast the retries.
+        `retry_after` is a hint in seconds for the client.
+    """
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class GeminiCallCancelled(Exception):
+    """
+        Raised instead of the next Gemini call once the caller gave up on the result.
+    """
+
+# Set by the caller before submitting to a pool, the pool call runs in a copy of its context.
+# Calls check it between requests: a call that is already on the wire cannot be interrupted.
+cancel_event_var: ContextVar[Optional[threading.Event]] = ContextVar("gemini_cancel_event", default=None)
+
+def _sleep(seconds: float):
+    """
+        Sleeps between attempts, waking up early when the caller cancels.
+    """
+
+    cancel_event = cancel_event_var.get()
+
+    if cancel_event is None:
+        time.sleep(seconds)
+    elif cancel_event.wait(seconds):
+        raise GeminiCallCancelled("The caller no longer waits for this Gemini call.")
+
+def _check_cancelled():
+    cancel_event = cancel_event_var.get()
+
+    if cancel_event is not None and cancel_event.is_set():
+        raise GeminiCallCancelled("The caller no longer waits for this Gemini call.")
+
+def is_transient(error: Exception) -> bool:
+    if isinstance(error, TRANSIENT_EXCEPTIONS):
+        return True
+
+    # Files API errors come from googleapiclient and carry the status on the response
+    status = getattr(getattr(error, "resp", None), "status", None)
+    return status is not None and int(status) in TRANSIENT_STATUSES
+
+class Budget:
+    """
+        Token bucket refilled continuously to `per_minute` units per minute.
+        The balance may go negative when a call turns out more expensive than estimated,
+        later calls then wait until it is paid back.
+    """
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.available = per_minute
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self.available = min(self.per_minute, self.available + (now - self.updated_at) * self.per_minute / 60)
+        self.updated_at = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+
+        if self.available >= min(amount, self.per_minute):
+            return 0.0
+
+        return (min(amount, self.per_minute) - self.available) * 60 / self.per_minute
+
+    def spend(self, amount: float):
+        self.available -= amount
+
+class CircuitBreaker:
+    """
+        Opens after `threshold` consecutive transient failures and fails calls fast
+        for `reset_seconds`. Then one trial call is let through (half open):
+        success closes the circuit, failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 0, 1, 2
+
+    def __init__(self, threshold: int, reset_seconds: float):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_running = False
+
+    def before_call(self, now: float) -> float:
+        """
+            Returns 0 if the call may go ahead, otherwise the seconds until the next trial.
+        """
+
+        if self.state == self.OPEN:
+            remaining = self.opened_at + self.reset_seconds - now
+
+            if remaining > 0:
+                return remaining
+
+            self.state = self.HALF_OPEN
+
+        if self.state == self.HALF_OPEN:
+            if self.trial_running:
+                return self.reset_seconds
+
+            self.trial_running = True
+
+        return 0.0
+
+    def record(self, success: bool, now: float):
+        self.trial_running = False
+
+        if success:
+            self.state = self.CLOSED
+            self.failures = 0
+            return
+
+        self.failures += 1
+
+        if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+            if self.state != self.OPEN:
+                logger.error(f"Gemini circuit breaker opened after {self.failures} failures")
+
+            self.state = self.OPEN
+            self.opened_at = now
+
+class GeminiClient:
+    """
+        Shared wrapper around the blocking Gemini SDK calls made by the inference pool.
+        generate_content calls wait for room in the requests-per-minute and
+        tokens-per-minute budgets. Transient errors (429, 5xx, timeouts) are retried
+        with jittered exponential backoff, and a circuit breaker fails calls fast
+        while Gemini keeps failing.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        tokens_per_request: float,
+        max_retries: int,
+        backoff_seconds: float,
+        max_backoff_seconds: float,
+        max_wait_seconds: float,
+        breaker_threshold: int,
+        breaker_reset_seconds: float
+    ):
+        self.requests = Budget(requests_per_minute)
+        self.tokens = Budget(tokens_per_minute)
+        self.tokens_per_request = tokens_per_request
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset_seconds)
+        self._lock = threading.Lock()
+
+        sample_gauge(GEMINI_BREAKER_STATE, lambda: self.breaker.state)
+        sample_gauge(GEMINI_BUDGET_AVAILABLE.labels("requests"), lambda: self.requests.available)
+        sample_gauge(GEMINI_BUDGET_AVAILABLE.labels("tokens"), lambda: self.tokens.available)
+
+    def _admit(self, operation: str, budgeted: bool):
+        """
+            Blocks until the breaker and the budgets allow one more call.
+        """
+
+        waited = 0.0
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                retry_after = self.breaker.before_call(now)
+
+                if retry_after:
+                    GEMINI_CALLS.labels(operation, "rejected").inc()
+                    raise GeminiUnavailable("Gemini is unavailable, the circuit breaker is open.", retry_after)
+
+                wait = 0.0
+
+                if budgeted:
+                    wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(self.tokens_per_request, now))
+
+                    if not wait:
+                        self.requests.spend(1)
+                        self.tokens.spend(self.tokens_per_request)
+
+                if not wait:
+                    break
+
+                # Not calling after all, give a half open trial back
+                self.breaker.trial_running = False
+
+            if waited + wait > self.max_wait_seconds:
+                GEMINI_CALLS.labels(operation, "rejected").inc()
+                raise GeminiUnavailable("Gemini request budget is exhausted.", wait)
+
+            _sleep(wait)
+            waited += wait
+
+        if waited:
+            GEMINI_THROTTLE_SECONDS.labels(operation).observe(waited)
+
+    def _settle_tokens(self, response):
+        # Replace the estimate by the real token count once it is known
+        usage = getattr(response, "usage_metadata", None)
+        total = getattr(usage, "total_token_count", None)
+
+        if total:
+            with self._lock:
+                self.tokens.spend(total - self.tokens_per_request)
+
+    def _call(self, operation: str, budgeted: bool, func, *args, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            _check_cancelled()
+            self._admit(operation, budgeted)
+
+            try:
+                result = func(*args, **kwargs)
+
+            except Exception as e:
+                transient = is_transient(e)
+
+                with self._lock:
+                    # Client errors say nothing about the health of Gemini
+                    self.breaker.record(not transient, time.monotonic())
+
+                if not transient:
+                    GEMINI_CALLS.labels(operation, "error").inc()
+                    raise
+
+                if attempt == self.max_retries:
+                    GEMINI_CALLS.labels(operation, "error").inc()
+                    raise GeminiUnavailable(f"Gemini {operation} failed after {attempt + 1} attempts: {e}", self.breaker.reset_seconds) from e
+
+                backoff = min(self.backoff_seconds * 2 ** attempt, self.max_backoff_seconds) * random.uniform(0.5, 1.5)
+                logger.warning(f"Gemini {operation} failed on attempt {attempt + 1}, retrying in {backoff:.1f}s. Error: {e}")
+                GEMINI_RETRIES.labels(operation).inc()
+                _sleep(backoff)
+                continue
+
+            with self._lock:
+                self.breaker.record(True, time.monotonic())
+
+            GEMINI_CALLS.labels(operation, "ok").inc()
+            return result
+
+    def generate_content(self, model: genai.GenerativeModel, contents, **kwargs):
+        response = self._call("generate_content", True, model.generate_content, contents, **kwargs)
+        self._settle_tokens(response)
+
+        return response
+
+    def upload_file(self, path: str, **kwargs):
+        return self._call("upload_file", False, genai.upload_file, path, **kwargs)
+
+gemini_client = GeminiClient(
+    requests_per_minute=Config.GEMINI_RPM,
+    tokens_per_minute=Config.GEMINI_TPM,
+    tokens_per_request=Config.GEMINI_TOKENS_PER_REQUEST,
+    max_retries=Config.GEMINI_MAX_RETRIES,
+    backoff_seconds=Config.GEMINI_BACKOFF_SECONDS,
+    max_backoff_seconds=Config.GEMINI_MAX_BACKOFF_SECONDS,
+    max_wait_seconds=Config.GEMINI_MAX_WAIT_SECONDS,
+    breaker_threshold=Config.GEMINI_BREAKER_THRESHOLD,
+    breaker_reset_seconds=Config.GEMINI_BREAKER_RESET_SECONDS
+)
@@ -0,0 +1,401 @@
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, Optional
+import contextvars
+import google.generativeai as genai
+import heapq
+import itertools
+import threading
+import time
+
+from app.config import Config
+from app.utils.gemini_client import GeminiCallCancelled, cancel_event_var
+from app.utils.logger import get_logger
+from app.utils.metrics import GEMINI_FILES, GEMINI_FILES_REGISTERED, sample_gauge
+
+logger = get_logger(__name__)
+
+# How often a waiting analysis checks whether its caller gave up
+CANCEL_CHECK_SECONDS = 0.25
+
+class FileActivationError(Exception):
+    """
+        Raised when an uploaded file does not become ACTIVE in Gemini.
+    """
+
+class ActivationPoller:
+    """
+        Waits for files uploaded to Gemini to leave the PROCESSING state.
+        One background thread polls every pending file, each on its own schedule:
+        a short first poll, then exponential backoff up to a maximum interval.
+        Every file gets a deadline that grows with its size, and a FAILED
+        state ends the wait right away.
+    """
+
+    def __init__(
+        self,
+        initial_delay: float,
+        max_delay: float,
+        backoff: float,
+        base_timeout: float,
+        timeout_per_mb: float
+    ):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.base_timeout = base_timeout
+        self.timeout_per_mb = timeout_per_mb
+        self._pending = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def deadline_for(self, size_bytes: int) -> float:
+        return self.base_timeout + self.timeout_per_mb * size_bytes / (1024 * 1024)
+
+    def wait_until_active(self, uploaded_file, size_bytes: int):
+        """
+            Blocks until the file is ACTIVE and returns its latest handle.
+            Raises FileActivationError if it fails or misses its deadline,
+            GeminiCallCancelled as soon as the caller cancels (see cancel_event_var).
+        """
+
+        state = uploaded_file.state.name
+
+        if state == "ACTIVE":
+            return uploaded_file
+
+        if state == "FAILED":
+            raise FileActivationError(f"Gemini failed to process {uploaded_file.name}")
+
+        now = time.monotonic()
+        future = Future()
+        entry = {
+            "name": uploaded_file.name,
+            "future": future,
+            "delay": self.initial_delay,
+            "started": now,
+            "deadline": now + self.deadline_for(size_bytes),
+            "polls": 0,
+            "cancelled": False,
+            "context": contextvars.copy_context()
+        }
+
+        with self._condition:
+            heapq.heappush(self._pending, (now + self.initial_delay, next(self._sequence), entry))
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="gemini-activation-poller", daemon=True)
+                self._thread.start()
+
+            self._condition.notify()
+
+        cancel_event = cancel_event_var.get()
+
+        if cancel_event is None:
+            return future.result()
+
+        while True:
+            try:
+                return future.result(timeout=CANCEL_CHECK_SECONDS)
+
+            except FutureTimeoutError:
+                if cancel_event.is_set():
+                    # The poller drops the file at its next poll
+                    entry["cancelled"] = True
+                    raise GeminiCallCancelled(f"Stopped waiting for Gemini file {uploaded_file.name}, the caller gave up.")
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+
+                poll_at, _, entry = self._pending[0]
+                delay = poll_at - time.monotonic()
+
+                if delay > 0:
+                    # Woken early when a new file is added, so its first poll is not delayed
+                    self._condition.wait(delay)
+                    continue
+
+                heapq.heappop(self._pending)
+
+            self._poll(entry)
+
+    def _poll(self, entry: dict):
+        if entry["cancelled"]:
+            return
+
+        entry["polls"] += 1
+
+        try:
+            uploaded_file = genai.get_file(entry["name"])
+            state = uploaded_file.state.name
+
+        except Exception as e:
+            # Logged in the waiting request's context, so it carries its request id
+            entry["context"].run(logger.warning, f"Failed to poll Gemini file {entry['name']}. Error: {e}")
+            state = None
+
+        now = time.monotonic()
+
+        if state == "ACTIVE":
+            entry["context"].run(logger.info, f"Gemini file {entry['name']} active after {now - entry['started']:.1f}s and {entry['polls']} polls")
+            entry["future"].set_result(uploaded_file)
+            return
+
+        if state == "FAILED":
+            entry["future"].set_exception(FileActivationError(f"Gemini failed to process {entry['name']}"))
+            return
+
+        if now >= entry["deadline"]:
+            entry["future"].set_exception(FileActivationError(
+                f"Gemini file {entry['name']} was not active after {now - entry['started']:.0f}s"
+            ))
+            return
+
+        entry["delay"] = min(entry["delay"] * self.backoff, self.max_delay)
+        poll_at = min(now + entry["delay"], entry["deadline"])
+
+        with self._condition:
+            heapq.heappush(self._pending, (poll_at, next(self._sequence), entry))
+
+activation_poller = ActivationPoller(
+    initial_delay=Config.GEMINI_POLL_INITIAL_SECONDS,
+    max_delay=Config.GEMINI_POLL_MAX_SECONDS,
+    backoff=Config.GEMINI_POLL_BACKOFF,
+    base_timeout=Config.GEMINI_ACTIVATION_TIMEOUT_SECONDS,
+    timeout_per_mb=Config.GEMINI_ACTIVATION_TIMEOUT_PER_MB_SECONDS
+)
+
+# Gemini deletes uploaded files on its own 48 hours after the upload
+GEMINI_FILE_LIFETIME_SECONDS = 48 * 60 * 60
+
+class FileRegistry:
+    """
+        Live Gemini file handles keyed by media type and content hash, so a re-analysis
+        or another prompt on the same media reuses the uploaded file instead of uploading it again.
+        Concurrent requests for a key share one upload. A handle is dropped once it has been idle
+        for `idle_seconds`, shortly before Gemini expires it, when the LRU evicts it or when the
+        media is deleted (evict), and a background reaper deletes it from Gemini.
+        Handles in use are deleted when released.
+    """
+
+    def __init__(self, max_entries: int, idle_seconds: float, expiry_margin: float, reap_interval: float):
+        self.max_entries = max_entries
+        self.idle_seconds = idle_seconds
+        self.expiry_margin = expiry_margin
+        self.reap_interval = reap_interval
+        self._entries = OrderedDict()
+        self._by_name: Dict[str, dict] = {}
+        self._doomed = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = None
+
+        sample_gauge(GEMINI_FILES_REGISTERED, lambda: len(self._entries))
+
+    def _expires_at(self, uploaded_file) -> float:
+        expiration_time = getattr(uploaded_file, "expiration_time", None)
+        remaining = expiration_time.timestamp() - time.time() if expiration_time else GEMINI_FILE_LIFETIME_SECONDS
+        return time.monotonic() + remaining - self.expiry_margin
+
+    def _usable(self, entry: dict, now: float) -> bool:
+        # An upload still running counts as usable, its waiters get the result
+        if not entry["future"].done():
+            return True
+
+        return now < entry["expires_at"] and (entry["refs"] > 0 or now - entry["last_used"] < self.idle_seconds)
+
+    def _evict(self, entry: dict):
+        # Caller holds the lock
+        if self._entries.get(entry["key"]) is entry:
+            del self._entries[entry["key"]]
+
+        entry["evicted"] = True
+
+        if entry["refs"] == 0 and entry["file"] is not None:
+            self._by_name.pop(entry["file"].name, None)
+            self._doomed.append(entry["file"])
+            self._wakeup.set()
+
+    def contains(self, key: Optional[str]) -> bool:
+        """
+            True if acquire(key) would not upload.
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and self._usable(entry, time.monotonic())
+
+    def evict(self, key: Optional[str]) -> bool:
+        """
+            Drops the handle for the key and has the reaper delete the file from Gemini,
+            once released if it is in use. Returns False when the key had no handle.
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                return False
+
+            self._evict(entry)
+
+        return True
+
+    def acquire(self, key: Optional[str], upload: Callable[[], object]):
+        """
+            Returns the live handle for the key, calling `upload` only when there is none.
+            Every acquired handle must be given back with release().
+            Without a key the file is uploaded and deleted on release, as if unregistered.
+        """
+
+        if key is None:
+            return upload()
+
+        with self._lock:
+            self._start()
+            now = time.monotonic()
+            entry = self._entries.get(key)
+
+            if entry is not None and not self._usable(entry, now):
+                self._evict(entry)
+                entry = None
+
+            owner = entry is None
+
+            if owner:
+                entry = {"key": key, "future": Future(), "file": None, "refs": 0, "last_used": now, "expires_at": now, "evicted": False}
+                self._entries[key] = entry
+
+            entry["refs"] += 1
+            entry["last_used"] = now
+            self._entries.move_to_end(key)
+
+        if not owner:
+            try:
+                uploaded_file = entry["future"].result()
+            except BaseException:
+                with self._lock:
+                    entry["refs"] -= 1
+                raise
+
+            GEMINI_FILES.labels("reused").inc()
+            return uploaded_file
+
+        try:
+            uploaded_file = upload()
+
+        except BaseException as e:
+            with self._lock:
+                entry["refs"] -= 1
+                self._evict(entry)
+
+            entry["future"].set_exception(e)
+            raise
+
+        with self._lock:
+            entry["file"] = uploaded_file
+            entry["expires_at"] = self._expires_at(uploaded_file)
+            entry["last_used"] = time.monotonic()
+            self._by_name[uploaded_file.name] = entry
+
+            while len(self._entries) > self.max_entries:
+                self._evict(next(iter(self._entries.values())))
+
+        entry["future"].set_result(uploaded_file)
+        GEMINI_FILES.labels("uploaded").inc()
+
+        return uploaded_file
+
+    def release(self, uploaded_file, discard: bool = False):
+        """
+            Gives back a handle from acquire(). With `discard` (a call with it failed,
+            the remote file may be gone) the next acquire uploads again.
+        """
+
+        with self._lock:
+            entry = self._by_name.get(uploaded_file.name)
+
+            if entry is not None:
+                entry["refs"] -= 1
+                entry["last_used"] = time.monotonic()
+
+                if discard or entry["evicted"] or self._closed:
+                    self._evict(entry)
+
+        if entry is not None:
+            # The reaper is gone after close, delete right away
+            if self._closed:
+                self.reap()
+
+            return
+
+        # Acquired without a key
+        self._delete(uploaded_file)
+
+    def _delete(self, uploaded_file):
+        try:
+            genai.delete_file(uploaded_file.name)
+            GEMINI_FILES.labels("deleted").inc()
+        except Exception as e:
+            logger.error(f"Failed to delete file {uploaded_file.name} from Gemini. Error: {e}")
+
+    def _start(self):
+        # Caller holds the lock
+        if self._thread is None and not self._closed:
+            self._thread = threading.Thread(target=self._run, name="gemini-file-reaper", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.reap_interval)
+            self._wakeup.clear()
+            self.reap()
+
+    def reap(self):
+        """
+            Drops idle and expiring handles and deletes every dropped file from Gemini.
+        """
+
+        with self._lock:
+            now = time.monotonic()
+
+            for entry in list(self._entries.values()):
+                if entry["refs"] == 0 and not self._usable(entry, now):
+                    self._evict(entry)
+
+            doomed, self._doomed = self._doomed, []
+
+        for uploaded_file in doomed:
+            self._delete(uploaded_file)
+
+        if doomed:
+            logger.info(f"Deleted {len(doomed)} Gemini files, {len(self._entries)} kept for reuse")
+
+    def close(self):
+        """
+            Deletes every registered file from Gemini, called on shutdown.
+        """
+
+        with self._lock:
+            self._closed = True
+
+            for entry in list(self._entries.values()):
+                self._evict(entry)
+
+        self._wakeup.set()
+        self.reap()
+
+    def stats(self) -> dict:
+        return {"files": len(self._entries), "in_use": sum(1 for entry in self._entries.values() if entry["refs"])}
+
+file_registry = FileRegistry(
+    max_entries=Config.GEMINI_FILE_REGISTRY_SIZE,
+    idle_seconds=Config.GEMINI_FILE_IDLE_SECONDS,
+    expiry_margin=Config.GEMINI_FILE_EXPIRY_MARGIN_SECONDS,
+    reap_interval=Config.GEMINI_FILE_REAPER_INTERVAL_SECONDS
+)
@@ -0,0 +1,198 @@
+from dataclasses import dataclass
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from typing import Dict, Optional, Tuple
+import aiofiles
+import hashlib
+
+from app.utils.logger import get_logger
+from app.utils.temp_files import create_temp_file, remove_temp_file
+
+logger = get_logger(__name__)
+
+INGEST_CHUNK_SIZE = 1024 * 1024  # 1 MB
+SNIFF_SIZE = 32  # Enough bytes for every signature below
+MULTIPART_OVERHEAD = 64 * 1024  # Room for the form fields and part headers next to the file
+
+@dataclass
+class IngestedFile:
+    """
+        Everything the analysis stages need from one streaming read of an upload.
+    """
+
+    path: str
+    size: int
+    content_hash: str
+    detected_mime_type: Optional[str]
+
+IMAGE = frozenset({"image"})
+AUDIO = frozenset({"audio"})
+VIDEO = frozenset({"video"})
+
+# Containers that carry a video or just an audio track, the first bytes do not tell which
+AUDIO_OR_VIDEO = frozenset({"audio", "video"})
+
+def sniff_iso_media(brand: bytes) -> Tuple[str, frozenset]:
+    """
+        Maps the major brand of an ISO base media file (the `ftyp` box) to its format.
+    """
+
+    if brand in (b"avif", b"avis"):
+        return "image/avif", IMAGE
+    if brand in (b"heic", b"heix", b"hevc", b"hevx"):
+        return "image/heic", IMAGE
+    if brand in (b"mif1", b"msf1"):
+        return "image/heif", IMAGE
+    if brand in (b"M4A ", b"M4B ", b"M4P "):
+        return "audio/mp4", AUDIO
+    if brand == b"qt  ":
+        return "video/quicktime", VIDEO
+    if brand.startswith((b"3gp", b"3g2")):
+        return "video/3gpp", AUDIO_OR_VIDEO
+
+    # isom, mp41, mp42, dash and the like hold a movie or an .m4a alike
+    return "video/mp4", AUDIO_OR_VIDEO
+
+def sniff_mime_type(head: bytes) -> Tuple[Optional[str], frozenset]:
+    """
+        Detects the format from the magic bytes at the start of a file.
+        Returns (mime_type, media types the format can hold), (None, empty set) for formats
+        it does not know. For containers that hold audio or video the mime type names video.
+    """
+
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png", IMAGE
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg", IMAGE
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif", IMAGE
+    if head.startswith(b"BM"):
+        return "image/bmp", IMAGE
+
+    if head.startswith(b"RIFF") and len(head) >= 12:
+        riff_type = head[8:12]
+
+        if riff_type == b"WEBP":
+            return "image/webp", IMAGE
+        if riff_type == b"WAVE":
+            return "audio/wav", AUDIO
+        if riff_type == b"AVI ":
+            return "video/x-msvideo", VIDEO
+
+    if head[4:8] == b"ftyp":
+        return sniff_iso_media(head[8:12])
+
+    # WebM and Matroska, .mka and audio-only .webm files included
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        return "video/webm", AUDIO_OR_VIDEO
+    if head.startswith(b"ID3") or head[:2] in (b"\xff\xfb", b"\xff\xf3", b"\xff\xf2"):
+        return "audio/mpeg", AUDIO
+    # Vorbis and Opus audio or Theora video
+    if head.startswith(b"OggS"):
+        return "video/ogg", AUDIO_OR_VIDEO
+    if head.startswith(b"fLaC"):
+        return "audio/flac", AUDIO
+
+    return None, frozenset()
+
+def size_limit_detail(max_size: int) -> str:
+    return f"File size exceeds the {max_size // (1024 * 1024)}MB limit."
+
+class UploadLimitMiddleware:
+    """
+        ASGI middleware that caps the request body of the upload endpoints.
+        The multipart parser spools every file to disk before the endpoint runs,
+        so the limit has to hold while the body is received: a larger Content-Length
+        is answered with 413 without reading the body, and a body that grows past
+        the limit (chunked, or a lying Content-Length) stops being received.
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > limit:
+                response = JSONResponse({"detail": size_limit_detail(limit)}, status_code=413)
+                await response(scope, receive, send)
+                return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+
+                # Raised inside the form parsing of the endpoint, FastAPI answers it as is
+                if received > limit:
+                    raise HTTPException(status_code=413, detail=size_limit_detail(limit))
+
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+async def ingest_upload(file: UploadFile, media_type: str, max_size: int) -> IngestedFile:
+    """
+        Copies a parsed upload to a temporary file in chunks.
+        In the same pass it enforces the per-file size limit, computes the SHA-256 content hash
+        and sniffs the magic bytes, so the upload is read exactly once.
+        Raises 413 when the file exceeds the limit and 415 when the content
+        is a known format of another media type.
+        The upload is already fully received here, UploadLimitMiddleware bounds
+        the request body before it is parsed.
+    """
+
+    if file.size and file.size > max_size:
+        raise HTTPException(status_code=413, detail=size_limit_detail(max_size))
+
+    digest = hashlib.sha256()
+    head = b""
+    size = 0
+
+    temp_file_path = create_temp_file()
+
+    try:
+        async with aiofiles.open(temp_file_path, "wb") as temp_file:
+            while chunk := await file.read(INGEST_CHUNK_SIZE):
+                size += len(chunk)
+
+                if size > max_size:
+                    raise HTTPException(status_code=413, detail=size_limit_detail(max_size))
+
+                if len(head) < SNIFF_SIZE:
+                    head += chunk[:SNIFF_SIZE - len(head)]
+
+                digest.update(chunk)
+                await temp_file.write(chunk)
+
+        detected_mime_type, media_types = sniff_mime_type(head)
+
+        if detected_mime_type and media_type not in media_types:
+            raise HTTPException(status_code=415, detail=f"Uploaded file is {detected_mime_type}, expected {media_type}.")
+
+        if detected_mime_type and not detected_mime_type.startswith(f"{media_type}/"):
+            # A container that holds audio as well as video, e.g. an .m4a or an .ogg audio file
+            detected_mime_type = f"{media_type}/{detected_mime_type.split('/')[1]}"
+
+    except BaseException:
+        remove_temp_file(temp_file_path)
+        raise
+
+    logger.info(f"Ingested {size} bytes ({detected_mime_type or 'unknown type'}) to {temp_file_path}")
+
+    return IngestedFile(
+        path=temp_file_path,
+        size=size,
+        content_hash=digest.hexdigest(),
+        detected_mime_type=detected_mime_type
+    )
@@ -1,23 +1,64 @@
 import google.generativeai as genai
-import time
+from typing import Callable, Optional
+import os
 
 from app.config import Config
-from app.utils.parse_llm_response import parse_llm_response
-from app.utils.logger import logger
+from app.utils.gemini_client import gemini_client
+from app.utils.gemini_files import activation_poller, file_registry
+from app.utils.parse_llm_response import parse_llm_response, parse_llm_batch_response
+from app.utils.logger import get_logger
+from app.utils.metrics import time_stage
+
+logger = get_logger(__name__)
+
+MODEL_NAME = "gemini-3-flash-preview"
+
+# Bump whenever a prompt changes, so cached verdicts of the old prompt are not reused.
+PROMPT_VERSION = 2
+ANALYSIS_VERSION = f"{MODEL_NAME}:v{PROMPT_VERSION}"
 
 genai.configure(api_key=Config.GEMINI_API_KEY)
-model = genai.GenerativeModel("gemini-3-flash-preview")
+model = genai.GenerativeModel(MODEL_NAME)
+
+VERDICT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "label": {"type": "string", "format": "enum", "enum": ["AI", "Real"]},
+        "confidence": {"type": "number"},
+        "reason": {"type": "string"}
+    },
+    "required": ["label", "confidence", "reason"]
+}
 
-def analyze_image_with_llm(temp_file_path: str, mime_type: str) -> str:
+BATCH_VERDICT_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {"index": {"type": "integer"}, **VERDICT_SCHEMA["properties"]},
+        "required": ["index", *VERDICT_SCHEMA["required"]]
+    }
+}
+
+# Constrain the model to bare JSON, so responses take the fast path of the parser
+verdict_config = genai.GenerationConfig(response_mime_type="application/json", response_schema=VERDICT_SCHEMA)
+batch_verdict_config = genai.GenerationConfig(response_mime_type="application/json", response_schema=BATCH_VERDICT_SCHEMA)
+
+def analyze_image_with_llm(temp_file_path: str, mime_type: str, file_key: Optional[str] = None) -> str:
     """
         Analyzes the image using a large language model(Gemini) to classify it as 'AI' or 'Real'.
+        With a `file_key` (see build_file_key) a live upload of the same image is reused.
     """
 
+    def upload():
+        with time_stage("image", "gemini_upload"):
+            return gemini_client.upload_file(temp_file_path, mime_type=mime_type)
+
     uploaded_image = None
+    failed = False
     
     try:
-        # Upload the image to Gemini
-        uploaded_image = genai.upload_file(temp_file_path, mime_type=mime_type)
+        # Upload the image to Gemini, unless it was uploaded recently
+        uploaded_image = file_registry.acquire(file_key, upload)
 
         prompt = """
             You are an expert visual content analyst. Your task is to determine whether the provided image is 'AI' or 'Real'.
@@ -38,7 +79,9 @@ def analyze_image_with_llm(temp_file_path: str, mime_type: str) -> str:
             Return **only** the JSON object, with no extra text.
         """
 
-        response = model.generate_content([uploaded_image, prompt])
+        with time_stage("image", "generate_content"):
+            response = gemini_client.generate_content(model, [uploaded_image, prompt], generation_config=verdict_config)
+
         parsed_response = parse_llm_response(response.text)
 
         label = parsed_response.get("label")
@@ -47,30 +90,52 @@ def analyze_image_with_llm(temp_file_path: str, mime_type: str) -> str:
 
         return label, confidence, reason
 
-    except Exception as e:
-        logger.error(f"Error in LLM analysis: {str(e)}")
+    except ValueError as e:
+        # Gemini answered, but not with a usable verdict. Upstream errors are raised instead.
+        logger.error(f"Invalid LLM response: {str(e)}")
         return "Unknown", 0.0, f"Error: {str(e)}"
     
+    except Exception:
+        failed = True
+        raise
+    
     finally:
         if uploaded_image:
-            genai.delete_file(uploaded_image)
-            logger.info("Cleaned up uploaded image from Gemini.")
+            release_gemini_file(uploaded_image, failed)
 
-def analyze_video_with_llm(temp_file_path: str, mime_type: str) -> str:
+def analyze_video_with_llm(
+    temp_file_path: str,
+    mime_type: str,
+    on_active: Optional[Callable[[], None]] = None,
+    file_key: Optional[str] = None
+) -> str:
     """
         Analyzes the video using a large language model(Gemini) to classify it as 'AI' or 'Real'.
+        `on_active` is called once Gemini has finished processing the uploaded video.
+        With a `file_key` (see build_file_key) a live upload of the same video is reused.
     """
+
+    def upload():
+        with time_stage("video", "gemini_upload"):
+            uploaded_video = gemini_client.upload_file(temp_file_path, mime_type=mime_type)
+
+        # Wait until the video is fully processed, only active files are registered
+        try:
+            with time_stage("video", "gemini_activation"):
+                return activation_poller.wait_until_active(uploaded_video, os.path.getsize(temp_file_path))
+        except Exception:
+            release_gemini_file(uploaded_video)
+            raise
     
     uploaded_video = None
+    failed = False
     
     try:
-        # Upload the video to Gemini
-        uploaded_video = genai.upload_file(temp_file_path, mime_type=mime_type)
+        # Upload the video to Gemini, unless it was uploaded recently
+        uploaded_video = file_registry.acquire(file_key, upload)
 
-        # Wait until the video is fully processed
-        while uploaded_video.state.name != "ACTIVE":
-            time.sleep(2)
-            uploaded_video = genai.get_file(uploaded_video.name)
+        if on_active:
+            on_active()
 
         prompt = """
             You are an expert visual content analyst. Your task is to determine whether the provided video is 'AI' or 'Real'.
@@ -91,7 +156,9 @@ def analyze_video_with_llm(temp_file_path: str, mime_type: str) -> str:
             Return **only** the JSON object, with no extra text.
         """
 
-        response = model.generate_content([uploaded_video, prompt])
+        with time_stage("video", "generate_content"):
+            response = gemini_client.generate_content(model, [uploaded_video, prompt], generation_config=verdict_config)
+
         parsed_response = parse_llm_response(response.text)
 
         label = parsed_response.get("label")
@@ -100,25 +167,35 @@ def analyze_video_with_llm(temp_file_path: str, mime_type: str) -> str:
 
         return label, confidence, reason
 
-    except Exception as e:
-        logger.error(f"Error in LLM analysis: {str(e)}")
+    except ValueError as e:
+        # Gemini answered, but not with a usable verdict. Upstream errors are raised instead.
+        logger.error(f"Invalid LLM response: {str(e)}")
         return "Unknown", 0.0, f"Error: {str(e)}"
     
+    except Exception:
+        failed = True
+        raise
+    
     finally:
         if uploaded_video:
-            genai.delete_file(uploaded_video)
-            logger.info("Cleaned up uploaded video from Gemini.")
+            release_gemini_file(uploaded_video, failed)
 
-def analyze_audio_with_llm(temp_file_path: str, mime_type: str) -> str:
+def analyze_audio_with_llm(temp_file_path: str, mime_type: str, file_key: Optional[str] = None) -> str:
     """
         Analyzes the audio using a large language model(Gemini) to classify it as 'AI' or 'Real'.
+        With a `file_key` (see build_file_key) a live upload of the same audio is reused.
     """
+
+    def upload():
+        with time_stage("audio", "gemini_upload"):
+            return gemini_client.upload_file(temp_file_path, mime_type=mime_type)
     
     uploaded_audio = None
+    failed = False
     
     try:
-        # Upload the audio to Gemini
-        uploaded_audio = genai.upload_file(temp_file_path, mime_type=mime_type)
+        # Upload the audio to Gemini, unless it was uploaded recently
+        uploaded_audio = file_registry.acquire(file_key, upload)
 
         prompt = """
             You are an expert audio forensics analyst. Your task is to determine whether the provided audio file is **AI** or **Real**.
@@ -139,7 +216,9 @@ def analyze_audio_with_llm(temp_file_path: str, mime_type: str) -> str:
             Return **only** the JSON object, with no extra text.
         """
 
-        response = model.generate_content([uploaded_audio, prompt])
+        with time_stage("audio", "generate_content"):
+            response = gemini_client.generate_content(model, [uploaded_audio, prompt], generation_config=verdict_config)
+
         parsed_response = parse_llm_response(response.text)
 
         label = parsed_response.get("label")
@@ -148,11 +227,92 @@ def analyze_audio_with_llm(temp_file_path: str, mime_type: str) -> str:
 
         return label, confidence, reason
 
-    except Exception as e:
-        logger.error(f"Error in LLM analysis: {str(e)}")
+    except ValueError as e:
+        # Gemini answered, but not with a usable verdict. Upstream errors are raised instead.
+        logger.error(f"Invalid LLM response: {str(e)}")
         return "Unknown", 0.0, f"Error: {str(e)}"
     
+    except Exception:
+        failed = True
+        raise
+    
     finally:
         if uploaded_audio:
-            genai.delete_file(uploaded_audio)
-            logger.info("Cleaned up uploaded audio from Gemini.")
\ No newline at end of file
+            release_gemini_file(uploaded_audio, failed)
+
+def build_file_key(content_hash: Optional[str], media_type: str) -> Optional[str]:
+    """
+        Builds the file registry key of a media file, None when the hash is unknown.
+    """
+
+    return f"{media_type}:{content_hash}" if content_hash else None
+
+def upload_file_to_gemini(temp_file_path: str, mime_type: str, metrics_label: str = "image_batch", file_key: Optional[str] = None):
+    """
+        Uploads a file to Gemini and returns the file handle, give it back with release_gemini_file.
+        With a `file_key` a live upload of the same file is reused.
+        The upload time is recorded under `metrics_label`, the pipeline's label for its stages.
+    """
+
+    def upload():
+        with time_stage(metrics_label, "gemini_upload"):
+            return gemini_client.upload_file(temp_file_path, mime_type=mime_type)
+
+    return file_registry.acquire(file_key, upload)
+
+def release_gemini_file(uploaded_file, failed: bool = False):
+    """
+        Gives back a file handle once a call is done with it.
+        Registered files stay on Gemini for reuse, others are deleted right away.
+        After a failed call the file is not reused, the remote file may be gone.
+    """
+
+    file_registry.release(uploaded_file, discard=failed)
+
+def analyze_image_batch_with_llm(uploaded_images: list) -> list:
+    """
+        Classifies several images already uploaded to Gemini with a single request.
+        Returns one (label, confidence, reason) tuple per image, in the same order.
+    """
+
+    try:
+        contents = []
+
+        for index, uploaded_image in enumerate(uploaded_images):
+            contents.extend([f"Image {index}:", uploaded_image])
+
+        prompt = f"""
+            You are an expert visual content analyst. You are given {len(uploaded_images)} images, numbered from 0 to {len(uploaded_images) - 1}.
+            Your task is to determine whether each image is 'AI' or 'Real'.
+
+            ### Instructions:
+            1. Carefully analyze the visual details of every image on its own.
+            2. Decide whether each image is **AI-generated** or **Real**.
+            3. Estimate your **confidence score** between 0 and 1 for each image.
+            4. Provide a **concise reason (≤ 30 words)** for each classification. Use simple English to ensure clarity.
+
+            ### Response Format (strictly follow this JSON structure, one object per image):
+            [
+            {{
+            "index": int,
+            "label": "AI" | "Real",
+            "confidence": float,
+            "reason": "string (≤ 30 words)"
+            }}
+            ]
+
+            Return **only** the JSON array, with no extra text.
+        """
+
+        contents.append(prompt)
+
+        with time_stage("image_batch", "generate_content"):
+            response = gemini_client.generate_content(model, contents, generation_config=batch_verdict_config)
+
+        verdicts = parse_llm_batch_response(response.text, len(uploaded_images))
+
+        return [(verdict["label"], verdict["confidence"], verdict["reason"]) for verdict in verdicts]
+
+    except ValueError as e:
+        logger.error(f"Invalid batch LLM response: {str(e)}")
+        return [("Unknown", 0.0, f"Error: {str(e)}")] * len(uploaded_images)
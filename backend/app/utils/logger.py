@@ -1,8 +1,188 @@
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+import atexit
+import json
 import logging
+import os
+import queue
+import random
+import sys
+import uuid
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
+# Correlation id of the request (or background job) being handled.
+# Pool threads see it too, see app/core/executors.py.
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
 
-logger = logging.getLogger(__name__)
+REQUEST_ID_HEADER = "x-request-id"
+
+# Attributes every LogRecord has, anything else was passed through `extra=`
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+def _parse_mapping(value: str) -> dict:
+    """
+        Parses "app.core.pipeline=DEBUG,app.crud=0.1" into a dict.
+    """
+
+    mapping = {}
+
+    for item in value.split(","):
+        if "=" in item:
+            name, setting = item.split("=", 1)
+            mapping[name.strip()] = setting.strip()
+
+    return mapping
+
+class JsonFormatter(logging.Formatter):
+    """
+        Formats a record as one JSON object per line.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "thread": record.threadName
+        }
+
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
+
+class ContextFilter(logging.Filter):
+    """
+        Stamps the correlation id on a record and samples records below WARNING.
+        Runs in the thread that logs, before the record is handed to the listener thread.
+    """
+
+    def __init__(self, sampling: dict):
+        super().__init__()
+        self.sampling = sampling
+        self._rates = {}
+
+    def _rate(self, name: str) -> float:
+        rate = self._rates.get(name)
+
+        if rate is None:
+            # The most specific configured prefix of the logger name wins
+            rate = 1.0
+            prefix = name
+
+            while prefix:
+                if prefix in self.sampling:
+                    rate = self.sampling[prefix]
+                    break
+                prefix = prefix.rpartition(".")[0]
+
+            self._rates[name] = rate
+
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            rate = self._rate(record.name)
+
+            if rate < 1.0 and random.random() >= rate:
+                return False
+
+        record.request_id = request_id_var.get()
+        return True
+
+def _configure() -> QueueListener:
+    level = os.getenv("LOG_LEVEL", "INFO").upper()
+    sampling = {name: float(rate) for name, rate in _parse_mapping(os.getenv("LOG_SAMPLING", "")).items()}
+
+    output = logging.StreamHandler(sys.stdout)
+
+    if os.getenv("LOG_FORMAT", "json") == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - [%(request_id)s] %(name)s - %(message)s"))
+
+    # Loggers only put records on an in-memory queue, a background thread writes them out
+    log_queue = queue.SimpleQueue()
+    handler = QueueHandler(log_queue)
+    handler.addFilter(ContextFilter(sampling))
+
+    app_logger = logging.getLogger("app")
+    app_logger.setLevel(level)
+    app_logger.addHandler(handler)
+    app_logger.propagate = False
+
+    for name, module_level in _parse_mapping(os.getenv("LOG_LEVELS", "")).items():
+        logging.getLogger(name).setLevel(module_level.upper())
+
+    listener = QueueListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+
+    return listener
+
+_listener = _configure()
+
+def get_logger(name: str) -> logging.Logger:
+    """
+        Returns the logger of a module. Pass __name__, so per-module levels
+        and sampling (LOG_LEVELS, LOG_SAMPLING) apply to it.
+    """
+
+    return logging.getLogger(name)
+
+def stop_logging():
+    """
+        Writes out the records still queued and stops the listener thread.
+    """
+
+    global _listener
+
+    if _listener:
+        _listener.stop()
+        _listener = None
+
+atexit.register(stop_logging)
+
+class RequestIdMiddleware:
+    """
+        ASGI middleware that gives every HTTP request a correlation id.
+        An incoming X-Request-ID header is reused, and the id is echoed on the response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+
+        for name, value in scope["headers"]:
+            if name == REQUEST_ID_HEADER.encode():
+                request_id = value.decode("latin-1")[:128]
+                break
+
+        request_id = request_id or uuid.uuid4().hex
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = [*message["headers"], (REQUEST_ID_HEADER.encode(), request_id.encode("latin-1"))]
+            await send(message)
+
+        token = request_id_var.set(request_id)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
+
+logger = get_logger("app")
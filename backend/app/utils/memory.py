@@ -0,0 +1,147 @@
+import gc
+import os
+import resource
+import sys
+import threading
+import time
+
+from app.config import Config
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def current_rss_bytes() -> int:
+    """
+        Returns the resident set size of this process.
+        Reads /proc on Linux and falls back to the peak RSS elsewhere.
+    """
+
+    try:
+        with open("/proc/self/statm", "rb") as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+
+    except (OSError, IndexError, ValueError):
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+class MemoryManager:
+    """
+        Replaces unconditional gc.collect() calls with a measured policy.
+        Every request records its RSS and allocated-block deltas, and a full
+        collection only runs when RSS is above the configured threshold and
+        the previous collection is old enough.
+    """
+
+    def __init__(self, rss_threshold_bytes: int, min_interval_seconds: float):
+        self.rss_threshold_bytes = rss_threshold_bytes
+        self.min_interval_seconds = min_interval_seconds
+        self._lock = threading.Lock()
+        self._last_collection = 0.0
+
+        self.requests = 0
+        self.rss_bytes = current_rss_bytes()
+        self.peak_rss_bytes = self.rss_bytes
+        self.rss_delta_total_bytes = 0
+        self.rss_delta_max_bytes = 0
+        self.allocated_blocks_total = 0
+        self.allocated_blocks_max = 0
+        self.collections = 0
+        self.collected_objects = 0
+        self.collection_pause_total_seconds = 0.0
+        self.collection_pause_max_seconds = 0.0
+
+    def start_request(self) -> tuple:
+        return current_rss_bytes(), sys.getallocatedblocks()
+
+    def finish_request(self, start: tuple):
+        """
+            Records the deltas of one request and collects garbage if the policy allows.
+            Requests run concurrently, so deltas are an approximation of each request's share.
+        """
+
+        start_rss, start_blocks = start
+        rss = current_rss_bytes()
+        rss_delta = max(rss - start_rss, 0)
+        allocated_blocks = max(sys.getallocatedblocks() - start_blocks, 0)
+
+        with self._lock:
+            self.requests += 1
+            self.rss_bytes = rss
+            self.peak_rss_bytes = max(self.peak_rss_bytes, rss)
+            self.rss_delta_total_bytes += rss_delta
+            self.rss_delta_max_bytes = max(self.rss_delta_max_bytes, rss_delta)
+            self.allocated_blocks_total += allocated_blocks
+            self.allocated_blocks_max = max(self.allocated_blocks_max, allocated_blocks)
+
+            now = time.monotonic()
+            should_collect = (
+                rss > self.rss_threshold_bytes
+                and now - self._last_collection >= self.min_interval_seconds
+            )
+
+            if should_collect:
+                self._last_collection = now
+
+        if should_collect:
+            self.collect()
+
+    def collect(self):
+        started = time.perf_counter()
+        collected = gc.collect()
+        pause = time.perf_counter() - started
+
+        with self._lock:
+            self.collections += 1
+            self.collected_objects += collected
+            self.collection_pause_total_seconds += pause
+            self.collection_pause_max_seconds = max(self.collection_pause_max_seconds, pause)
+
+        logger.info(f"RSS above {self.rss_threshold_bytes // (1024 * 1024)}MB, collected {collected} objects in {pause * 1000:.1f}ms")
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = self.requests or 1
+
+            return {
+                "requests": self.requests,
+                "rss_bytes": self.rss_bytes,
+                "peak_rss_bytes": self.peak_rss_bytes,
+                "rss_threshold_bytes": self.rss_threshold_bytes,
+                "avg_rss_delta_bytes": self.rss_delta_total_bytes // requests,
+                "max_rss_delta_bytes": self.rss_delta_max_bytes,
+                "avg_allocated_blocks": self.allocated_blocks_total // requests,
+                "max_allocated_blocks": self.allocated_blocks_max,
+                "collections": self.collections,
+                "collected_objects": self.collected_objects,
+                "collection_pause_total_seconds": self.collection_pause_total_seconds,
+                "collection_pause_max_seconds": self.collection_pause_max_seconds,
+                "gc_counts": gc.get_count()
+            }
+
+class MemoryMiddleware:
+    """
+        ASGI middleware that feeds every HTTP request into the memory manager.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = memory_manager.start_request()
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            memory_manager.finish_request(start)
+
+memory_manager = MemoryManager(
+    rss_threshold_bytes=Config.GC_RSS_THRESHOLD_MB * 1024 * 1024,
+    min_interval_seconds=Config.GC_MIN_INTERVAL_SECONDS
+)
@@ -0,0 +1,260 @@
+from contextlib import contextmanager
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from typing import Callable
+import asyncio
+import os
+import time
+
+from app.core.executors import upload_executor, inference_executor, preprocess_executor
+
+# Set by run.py when several workers serve the app. Counters and histograms are then
+# written to files in this directory and /metrics aggregates the files of every worker.
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+# Request stages take from a few milliseconds (cache lookups) to minutes (video activation)
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 60, 120, 300)
+
+STAGE_SECONDS = Histogram(
+    "aidentify_stage_seconds",
+    "Time spent in each analysis stage. Pipeline stages (ingest, upload, preprocess, infer, persist) "
+    "contain the finer steps (temp_file_write, gemini_upload, gemini_activation, generate_content, mongo_write).",
+    ["media_type", "stage"],
+    buckets=STAGE_BUCKETS
+)
+
+REQUEST_SECONDS = Histogram(
+    "aidentify_http_request_seconds",
+    "HTTP request latency by route template and status code.",
+    ["method", "route", "status"],
+    buckets=STAGE_BUCKETS
+)
+
+ERRORS = Counter(
+    "aidentify_errors_total",
+    "Analysis stages that raised an error.",
+    ["media_type", "stage"]
+)
+
+UNKNOWN_VERDICTS = Counter(
+    "aidentify_unknown_verdicts_total",
+    "Analyses whose parsed LLM response gave the Unknown label.",
+    ["media_type"]
+)
+
+IN_FLIGHT = Gauge(
+    "aidentify_requests_in_flight",
+    "HTTP requests currently being handled.",
+    multiprocess_mode="livesum"
+)
+
+ADMISSION_REJECTIONS = Counter(
+    "aidentify_admission_rejections_total",
+    "Analyze requests rejected with 429 by admission control.",
+    ["media_type", "reason"]
+)
+
+ADMISSION_WAITING = Gauge(
+    "aidentify_admission_waiting",
+    "Admitted analyze requests waiting for a free analysis slot.",
+    multiprocess_mode="livesum"
+)
+
+GEMINI_CALLS = Counter(
+    "aidentify_gemini_calls_total",
+    "Gemini SDK calls by outcome: ok, error, or rejected without calling (breaker open, budget exhausted).",
+    ["operation", "outcome"]
+)
+
+GEMINI_RETRIES = Counter(
+    "aidentify_gemini_retries_total",
+    "Gemini calls retried after a transient error.",
+    ["operation"]
+)
+
+GEMINI_THROTTLE_SECONDS = Histogram(
+    "aidentify_gemini_throttle_seconds",
+    "Time Gemini calls waited for room in the request and token budgets.",
+    ["operation"],
+    buckets=STAGE_BUCKETS
+)
+
+GEMINI_BREAKER_STATE = Gauge(
+    "aidentify_gemini_breaker_state",
+    "Gemini circuit breaker state: 0 closed, 1 open, 2 half open. One series per worker (pid label) with several workers.",
+    multiprocess_mode="liveall"
+)
+
+GEMINI_BUDGET_AVAILABLE = Gauge(
+    "aidentify_gemini_budget_available",
+    "Requests and tokens left in the per-minute Gemini budgets of this worker. One series per worker (pid label) with several workers.",
+    ["budget"],
+    multiprocess_mode="liveall"
+)
+
+GEMINI_FILES = Counter(
+    "aidentify_gemini_files_total",
+    "Gemini file handles by outcome: uploaded, reused from the file registry, or deleted.",
+    ["outcome"]
+)
+
+GEMINI_FILES_REGISTERED = Gauge(
+    "aidentify_gemini_files_registered",
+    "Gemini files kept for reuse, summed over the workers.",
+    multiprocess_mode="livesum"
+)
+
+RESPONSE_CACHE_REQUESTS = Counter(
+    "aidentify_response_cache_requests_total",
+    "Chat read requests by response cache outcome: hit, miss, and not_modified (304, counted on top).",
+    ["outcome"]
+)
+
+RESPONSE_CACHE_BYTES = Gauge(
+    "aidentify_response_cache_bytes",
+    "Size of the response bodies held by the response caches, summed over the workers.",
+    multiprocess_mode="livesum"
+)
+
+WEBHOOK_EVENTS = Counter(
+    "aidentify_webhook_events_total",
+    "Webhook deliveries by outcome: handled, ignored (unhandled type), duplicate (replayed id) or invalid signature.",
+    ["source", "outcome"]
+)
+
+EXECUTOR_QUEUE_DEPTH = Gauge(
+    "aidentify_executor_queue_depth",
+    "Calls waiting for a free worker in each pool, summed over the workers.",
+    ["pool"],
+    multiprocess_mode="livesum"
+)
+
+# Durable queues are read from MongoDB, every worker sees the same numbers
+QUEUE_DEPTH = Gauge(
+    "aidentify_queue_depth",
+    "Jobs in the durable background queues by status.",
+    ["queue", "status"],
+    multiprocess_mode="livemostrecent"
+)
+
+QUEUE_LAG_SECONDS = Gauge(
+    "aidentify_queue_lag_seconds",
+    "How long the oldest job that is ready to run has been waiting.",
+    ["queue"],
+    multiprocess_mode="livemostrecent"
+)
+
+VIDEO_JOBS_QUEUED = Gauge(
+    "aidentify_video_jobs_queued",
+    "Video jobs waiting for a job worker, summed over the workers.",
+    multiprocess_mode="livesum"
+)
+
+# Gauges computed from live objects. Function gauges are not written to the multiprocess
+# files, so with several workers each worker samples them into plain gauges instead.
+_sampled_gauges = []
+
+def sample_gauge(gauge: Gauge, func: Callable[[], float]):
+    """
+        Reports func() as the value of the gauge (or gauge child).
+    """
+
+    if MULTIPROCESS:
+        _sampled_gauges.append((gauge, func))
+    else:
+        gauge.set_function(func)
+
+def refresh_sampled_gauges():
+    for gauge, func in _sampled_gauges:
+        gauge.set(func())
+
+async def sample_gauges_forever(interval_seconds: float):
+    """
+        Refreshes the sampled gauges of this worker, runs for the whole app lifespan.
+    """
+
+    while True:
+        refresh_sampled_gauges()
+        await asyncio.sleep(interval_seconds)
+
+def render_metrics() -> tuple:
+    """
+        Returns the exposition body and content type, aggregated over the workers in multiprocess mode.
+    """
+
+    if not MULTIPROCESS:
+        return generate_latest(), CONTENT_TYPE_LATEST
+
+    refresh_sampled_gauges()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+def mark_worker_dead():
+    """
+        Drops the live gauges of this worker from the aggregate, called on shutdown.
+    """
+
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
+
+sample_gauge(EXECUTOR_QUEUE_DEPTH.labels("upload"), lambda: upload_executor._work_queue.qsize())
+sample_gauge(EXECUTOR_QUEUE_DEPTH.labels("inference"), lambda: inference_executor._work_queue.qsize())
+sample_gauge(EXECUTOR_QUEUE_DEPTH.labels("preprocess"), lambda: len(preprocess_executor._pending_work_items))
+
+@contextmanager
+def time_stage(media_type: str, stage: str):
+    """
+        Records how long the block takes in the stage histogram, also when it raises.
+    """
+
+    started = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(media_type, stage).observe(time.perf_counter() - started)
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+
+    if route is None:
+        return "unmatched"
+
+    # Depending on the FastAPI version the matched route may not carry its router prefix,
+    # it is recovered from the leading segments of the request path
+    segments = scope["path"].split("/")
+    prefix = "/".join(segments[:max(len(segments) - route.path.count("/"), 1)])
+
+    return prefix + route.path
+
+class MetricsMiddleware:
+    """
+        ASGI middleware that counts in-flight HTTP requests and records their latency.
+        Requests are labelled with the route template, never the raw path, so path
+        parameters such as job ids do not create new series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        IN_FLIGHT.inc()
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            IN_FLIGHT.dec()
+            REQUEST_SECONDS.labels(scope["method"], _route_label(scope), str(status[0])).observe(time.perf_counter() - started)
@@ -1,26 +1,112 @@
 import json
-import re
+import math
 
-def parse_llm_response(response: str) -> dict:
+# Accepted spellings of each label, mapped to the stored label
+LABELS = {"ai": "AI", "real": "Real"}
+
+_decoder = json.JSONDecoder()
+
+def _extract_verdict(data: dict) -> dict:
     """
-        Parses the LLM response string into a dictionary.
-        Expects the response to be a JSON string with keys: label, confidence, reason.
+        Validates one verdict: the label must be one of LABELS and
+        confidence is clamped to [0, 1].
     """
 
-    match = re.search(r'\{.*\}', response, re.DOTALL)
-
-    if not match:
-        raise ValueError("No JSON object found in the response.")
-    
-    json_str = match.group(0)
-    data = json.loads(json_str)
+    if not isinstance(data, dict):
+        raise ValueError("Verdict is not a JSON object.")
 
     label = data.get("label")
+
+    if label not in ("AI", "Real"):
+        label = LABELS.get(str(label).strip().lower())
+
+        if label is None:
+            raise ValueError(f"Unexpected label: {data.get('label')!r}")
+
     confidence = data.get("confidence")
-    reason = data.get("reason")
+
+    if type(confidence) is not float:
+        try:
+            confidence = float(confidence)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid confidence: {data.get('confidence')!r}")
+
+    # A single comparison for the usual in-range value, NaN fails it too
+    if not 0.0 <= confidence <= 1.0:
+        if math.isnan(confidence):
+            raise ValueError("Confidence is NaN.")
+
+        confidence = min(max(confidence, 0.0), 1.0)
 
     return {
         "label": label,
         "confidence": confidence,
-        "reason": reason
+        "reason": data.get("reason")
     }
+
+def _load_json(response: str, opening: str):
+    """
+        Loads the JSON value of a model response.
+        Structured output is bare JSON and is decoded directly.
+        Otherwise (code fences, text around the JSON, bare JSON of the other kind)
+        decoding starts at the first `opening` character and ignores anything after the value.
+    """
+
+    # json.loads skips surrounding whitespace itself, no strip or prefix check on the strict path
+    try:
+        data = json.loads(response)
+
+        if isinstance(data, dict if opening == "{" else list):
+            return data
+
+    except json.JSONDecodeError:
+        pass
+
+    start = response.find(opening)
+
+    if start < 0:
+        kind = "object" if opening == "{" else "array"
+        raise ValueError(f"No JSON {kind} found in the response.")
+
+    data, _ = _decoder.raw_decode(response, start)
+    return data
+
+def parse_llm_response(response: str) -> dict:
+    """
+        Parses the LLM response string into a dictionary.
+        Expects the response to be a JSON string with keys: label, confidence, reason.
+    """
+
+    return _extract_verdict(_load_json(response, "{"))
+
+def parse_llm_batch_response(response: str, expected_count: int) -> list:
+    """
+        Parses a batch LLM response into one verdict dictionary per item.
+        Expects a JSON array of objects with keys: index, label, confidence, reason.
+        Items are placed by their index (or position if the index is missing),
+        items the model skipped or returned invalid get an "Unknown" verdict.
+    """
+
+    data = _load_json(response, "[")
+
+    if not isinstance(data, list):
+        raise ValueError("Batch response is not a JSON array.")
+
+    verdicts = [None] * expected_count
+
+    for position, item in enumerate(data):
+        if not isinstance(item, dict):
+            continue
+
+        index = item.get("index", position)
+
+        if isinstance(index, int) and 0 <= index < expected_count and verdicts[index] is None:
+            try:
+                verdicts[index] = _extract_verdict(item)
+            except ValueError:
+                continue
+
+    return [
+        verdict or {"label": "Unknown", "confidence": 0.0, "reason": "No verdict was returned for this item."}
+        for verdict in verdicts
+    ]
@@ -0,0 +1,214 @@
+from dataclasses import dataclass
+from PIL import Image, ImageOps
+import asyncio
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+
+from app.config import Config
+from app.core.executors import preprocess_executor
+from app.utils.logger import get_logger
+from app.utils.temp_files import track_temp_file
+
+logger = get_logger(__name__)
+
+@dataclass
+class MediaProxy:
+    path: str
+    mime_type: str
+    original_size: int
+    size: int
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_size - self.size
+
+def _proxy_path(suffix: str) -> str:
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    return path
+
+def _run_ffmpeg(arguments: list, suffix: str) -> str:
+    output_path = _proxy_path(suffix)
+
+    try:
+        subprocess.run(
+            ["ffmpeg", "-y", "-v", "error", *arguments, output_path],
+            check=True,
+            capture_output=True,
+            timeout=Config.PREPROCESS_TIMEOUT_SECONDS
+        )
+    except BaseException:
+        os.remove(output_path)
+        raise
+
+    return output_path
+
+def downscale_image(file_path: str, max_side: int, quality: int) -> tuple:
+    """
+        Re-encodes an image as a JPEG whose longest side is at most max_side.
+    """
+
+    with Image.open(file_path) as image:
+        # Phone photos are stored sideways with an EXIF orientation tag, the JPEG written below drops it
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side))
+        output_path = _proxy_path(".jpg")
+        image.convert("RGB").save(output_path, "JPEG", quality=quality, optimize=True)
+
+    return output_path, "image/jpeg"
+
+def transcode_video(file_path: str, max_height: int, fps: int, crf: int) -> tuple:
+    """
+        Builds an H.264 proxy of a video with bounded height and frame rate and a mono audio track.
+    """
+
+    output_path = _run_ffmpeg([
+        "-i", file_path,
+        "-vf", f"scale=-2:'min({max_height},ih)',fps={fps}",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", str(crf),
+        "-c:a", "aac", "-ac", "1", "-b:a", "64k"
+    ], ".mp4")
+
+    return output_path, "video/mp4"
+
+def transcode_audio(file_path: str, sample_rate: int) -> tuple:
+    """
+        Builds a mono FLAC proxy of an audio file resampled to sample_rate.
+    """
+
+    output_path = _run_ffmpeg([
+        "-i", file_path,
+        "-vn", "-ac", "1", "-ar", str(sample_rate),
+        "-c:a", "flac"
+    ], ".flac")
+
+    return output_path, "audio/flac"
+
+def _discard_proxy(future):
+    if future.cancelled() or future.exception():
+        return
+
+    proxy_path, _ = future.result()
+
+    try:
+        os.remove(proxy_path)
+    except OSError as e:
+        logger.warning(f"Failed to delete proxy {proxy_path}. Error: {e}")
+
+class Preprocessor:
+    """
+        Optional stage that shrinks media before it is uploaded to Gemini.
+        Only the copy sent to the model is re-encoded, Cloudinary keeps the original.
+        A proxy that fails or is not smaller than the original is dropped and the
+        original is analyzed instead.
+    """
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.files = 0
+        self.proxies = 0
+        self.failures = 0
+        self.original_bytes = 0
+        self.bytes_saved = 0
+
+    def _job(self, media_type: str):
+        if media_type == "image":
+            return downscale_image, (Config.IMAGE_PROXY_MAX_SIDE, Config.IMAGE_PROXY_QUALITY)
+
+        if not shutil.which("ffmpeg"):
+            return None
+
+        if media_type == "video":
+            return transcode_video, (Config.VIDEO_PROXY_MAX_HEIGHT, Config.VIDEO_PROXY_FPS, Config.VIDEO_PROXY_CRF)
+
+        if media_type == "audio":
+            return transcode_audio, (Config.AUDIO_PROXY_SAMPLE_RATE,)
+
+        return None
+
+    def _submit(self, file_path: str, media_type: str):
+        job = self._job(media_type) if self.enabled else None
+
+        if not job:
+            return None
+
+        func, arguments = job
+        return preprocess_executor.submit(func, file_path, *arguments)
+
+    def _finish(self, future, file_path: str, media_type: str, mime_type: str) -> MediaProxy:
+        original_size = os.path.getsize(file_path)
+        original = MediaProxy(file_path, mime_type, original_size, original_size)
+
+        if future is None:
+            return original
+
+        try:
+            proxy_path, proxy_mime_type = future.result()
+
+        except Exception as e:
+            logger.warning(f"Failed to preprocess {media_type}, analyzing the original. Error: {e}")
+
+            with self._lock:
+                self.files += 1
+                self.failures += 1
+                self.original_bytes += original_size
+
+            return original
+
+        proxy = MediaProxy(proxy_path, proxy_mime_type, original_size, os.path.getsize(proxy_path))
+
+        if proxy.bytes_saved <= 0:
+            os.remove(proxy_path)
+            proxy = original
+        else:
+            track_temp_file(proxy_path)
+
+        with self._lock:
+            self.files += 1
+            self.original_bytes += original_size
+
+            if proxy is not original:
+                self.proxies += 1
+                self.bytes_saved += proxy.bytes_saved
+
+        if proxy is not original:
+            logger.info(f"Preprocessed {media_type}: {original_size} -> {proxy.size} bytes ({proxy.bytes_saved} saved)")
+
+        return proxy
+
+    async def prepare_async(self, file_path: str, media_type: str, mime_type: str) -> MediaProxy:
+        """
+            Returns the file to upload to Gemini, either a proxy or the original,
+            while a worker process re-encodes the file.
+        """
+
+        future = self._submit(file_path, media_type)
+
+        if future is not None:
+            try:
+                await asyncio.wait([asyncio.wrap_future(future)])
+
+            except asyncio.CancelledError:
+                # The worker process keeps writing the proxy, nobody will read it
+                future.cancel()
+                future.add_done_callback(_discard_proxy)
+                raise
+
+        return self._finish(future, file_path, media_type, mime_type)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "files": self.files,
+                "proxies": self.proxies,
+                "failures": self.failures,
+                "original_bytes": self.original_bytes,
+                "bytes_saved": self.bytes_saved
+            }
+
+preprocessor = Preprocessor(enabled=Config.PREPROCESS_ENABLED)
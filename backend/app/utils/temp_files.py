@@ -0,0 +1,85 @@
+from concurrent.futures import Future
+from typing import Iterable
+import os
+import tempfile
+import threading
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Temporary files of this process that were not deleted yet
+_live_files = set()
+_live_files_lock = threading.Lock()
+
+def track_temp_file(file_path: str):
+    """
+        Registers a temporary file, so it is deleted at shutdown if nothing else deletes it.
+    """
+
+    with _live_files_lock:
+        _live_files.add(file_path)
+
+def create_temp_file(suffix: str = "") -> str:
+    """
+        Creates an empty temporary file and returns its path.
+    """
+
+    fd, file_path = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    track_temp_file(file_path)
+
+    return file_path
+
+def _remove(file_path: str):
+    with _live_files_lock:
+        _live_files.discard(file_path)
+
+    try:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+            logger.info(f"Temporary file {file_path} deleted.")
+
+    except OSError as e:
+        logger.error(f"Failed to delete temporary file {file_path}. Error: {e}")
+
+def remove_temp_file(file_path: str, readers: Iterable[Future] = ()):
+    """
+        Deletes a temporary file once every pool call still reading it has finished.
+        Without readers (or when all are done) the file is deleted right away.
+    """
+
+    readers = list(readers)
+
+    if not readers:
+        _remove(file_path)
+        return
+
+    remaining = [len(readers)]
+    lock = threading.Lock()
+
+    def release(_future: Future):
+        with lock:
+            remaining[0] -= 1
+            is_last = remaining[0] == 0
+
+        if is_last:
+            _remove(file_path)
+
+    for future in readers:
+        future.add_done_callback(release)
+
+def remove_leftover_temp_files():
+    """
+        Deletes every tracked temporary file that still exists. Called at shutdown,
+        after the pools have finished the calls that were reading them.
+    """
+
+    with _live_files_lock:
+        leftovers = list(_live_files)
+
+    for file_path in leftovers:
+        _remove(file_path)
+
+    if leftovers:
+        logger.info(f"Deleted {len(leftovers)} leftover temporary files at shutdown.")
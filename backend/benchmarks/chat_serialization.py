@@ -0,0 +1,111 @@
+"""
+    Serialization cost of the chat history response, per 1,000 chats.
+      - response_model: what FastAPI does for `response_model=List[ChatSchema]`,
+        validate into models, dump them in JSON mode, then json.dumps
+      - pydantic json:  validate, then pydantic-core's dump_json
+      - fast_json:      app.utils.fast_json, orjson straight from the Mongo documents
+
+    Chats are generated as Motor returns them (ObjectId ids, naive datetimes),
+    with extra fields the response model leaves out. No database is needed.
+
+    Usage (from the backend directory):
+        python -m benchmarks.chat_serialization --chats 1000 --messages 20
+"""
+
+import argparse
+import copy
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+from bson import ObjectId
+from pydantic import TypeAdapter
+
+from app.schemas.chat_schema import ChatSchema
+from app.utils import fast_json
+
+HISTORY_ADAPTER = TypeAdapter(List[ChatSchema])
+CHAT_SHAPE = fast_json.Shape(ChatSchema)
+
+def build_chats(count: int, messages_per_chat: int) -> list:
+    now = datetime.now().replace(microsecond=123000)
+    chats = []
+
+    for index in range(count):
+        messages = []
+
+        for number in range(messages_per_chat // 2):
+            created_at = now - timedelta(minutes=index * 60 + number)
+            url = f"https://res.cloudinary.com/demo/image/upload/v1/AIdentify/images/{uuid.uuid4().hex}.png"
+
+            messages.append({"id": str(uuid.uuid4()), "role": "user", "type": "image", "content": url, "created_at": created_at})
+            messages.append({
+                "id": str(uuid.uuid4()), "role": "aidentify", "type": "image", "content": url,
+                "label": "AI", "confidence": 0.93,
+                "reason": "Texture and lighting are too uniform, the background text is malformed.",
+                "created_at": created_at
+            })
+
+        chats.append({
+            "_id": ObjectId(),
+            "clerk_user_id": "user_2abc",
+            "user_email": "user@example.com",
+            "title": f"Image Analysis {index}",
+            "created_at": now - timedelta(hours=index),
+            "last_label": "AI",
+            "last_message_at": now,
+            "messages": messages
+        })
+
+    return chats
+
+def response_model(chats: list) -> bytes:
+    # get_chat_history converted ObjectId to str by hand before returning the documents
+    for chat in chats:
+        chat["_id"] = str(chat["_id"])
+
+    models = HISTORY_ADAPTER.validate_python(chats)
+    content = HISTORY_ADAPTER.dump_python(models, mode="json", by_alias=True)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+def pydantic_json(chats: list) -> bytes:
+    for chat in chats:
+        chat["_id"] = str(chat["_id"])
+
+    return HISTORY_ADAPTER.dump_json(HISTORY_ADAPTER.validate_python(chats), by_alias=True)
+
+def fast(chats: list) -> bytes:
+    return fast_json.dumps(CHAT_SHAPE, chats, many=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=20, help="Messages per chat")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{args.chats} chats, {args.messages} messages each, best of {args.rounds} rounds\n")
+
+    chats = build_chats(args.chats, args.messages)
+    outputs = {}
+
+    for name, serialize in (("response_model", response_model), ("pydantic json", pydantic_json), ("fast_json", fast)):
+        timings = []
+
+        for _ in range(args.rounds):
+            # The serializers may convert ids in place, each round gets fresh documents
+            documents = copy.deepcopy(chats)
+            started = time.perf_counter()
+            outputs[name] = serialize(documents)
+            timings.append(time.perf_counter() - started)
+
+        per_thousand = min(timings) * 1000 / args.chats
+        print(f"{name:<15} {per_thousand * 1000:8.1f}ms per 1,000 chats  {len(outputs[name]) / 1024:8.0f} KiB")
+
+    parsed = [json.loads(output) for output in outputs.values()]
+    print(f"\nOutputs equal: {all(output == parsed[0] for output in parsed)}")
+
+if __name__ == "__main__":
+    main()
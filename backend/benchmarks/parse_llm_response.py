@@ -0,0 +1,98 @@
+"""
+    Microbenchmark of parse_llm_response against the previous regex-only parser.
+
+    Runs both parsers over the sample responses in data/llm_responses.json
+    and reports the best time per response over --repeats runs. Batch responses
+    are parsed with parse_llm_batch_response.
+
+    The corpus is hand-written in the shapes the prompts produce, not recorded
+    model output. The legacy parser does no validation at all, so the numbers
+    show what label and confidence checking costs, and which responses the
+    legacy parser could not read. Expect roughly equal times for bare JSON.
+
+    Usage (from the backend directory):
+        python -m benchmarks.parse_llm_response --rounds 2000
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+
+from app.utils.parse_llm_response import parse_llm_response, parse_llm_batch_response
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "data", "llm_responses.json")
+
+def legacy_parse_llm_response(response: str) -> dict:
+    match = re.search(r'\{.*\}', response, re.DOTALL)
+
+    if not match:
+        raise ValueError("No JSON object found in the response.")
+
+    data = json.loads(match.group(0))
+    return {"label": data.get("label"), "confidence": data.get("confidence"), "reason": data.get("reason")}
+
+def legacy_parse_llm_batch_response(response: str, expected_count: int) -> list:
+    match = re.search(r'\[.*\]', response, re.DOTALL)
+    return json.loads(match.group(0))
+
+def is_batch(response: str) -> bool:
+    return response.lstrip().startswith(("[", "```json\n["))
+
+def is_bare_json(response: str) -> bool:
+    try:
+        json.loads(response)
+        return True
+    except json.JSONDecodeError:
+        return False
+
+def time_parser(parse, responses: list, rounds: int, repeats: int) -> tuple:
+    timings = []
+
+    for _ in range(repeats):
+        failures = 0
+        started = time.perf_counter()
+
+        for _ in range(rounds):
+            for response in responses:
+                try:
+                    parse(response)
+                except ValueError:
+                    failures += 1
+
+        timings.append(time.perf_counter() - started)
+
+    return min(timings) / (rounds * len(responses)), failures // rounds
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    with open(CORPUS_PATH, encoding="utf-8") as corpus:
+        responses = json.load(corpus)["responses"]
+
+    groups = {
+        "single, bare JSON": [r for r in responses if not is_batch(r) and is_bare_json(r)],
+        "single, wrapped": [r for r in responses if not is_batch(r) and not is_bare_json(r)],
+        "batch of 10": [r for r in responses if is_batch(r)]
+    }
+
+    parsers = {
+        "legacy": (legacy_parse_llm_response, legacy_parse_llm_batch_response),
+        "current": (parse_llm_response, parse_llm_batch_response)
+    }
+
+    print(f"{len(responses)} responses, {args.rounds} rounds, best of {args.repeats}\n")
+
+    for group, group_responses in groups.items():
+        for name, (single, batch) in parsers.items():
+            parse = (lambda response: batch(response, 10)) if group == "batch of 10" else single
+            per_response, failures = time_parser(parse, group_responses, args.rounds, args.repeats)
+
+            print(f"{group:<18} {name:<8} {per_response * 1e6:7.2f}us/response  {failures} of {len(group_responses)} failed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+    Load test of the development and production server profiles from run.py.
+      - development: one process, reload=True, limit_concurrency=3
+      - production:  one worker per core, uvloop/httptools when installed, Config limits
+
+    Each profile serves a stand-in analysis endpoint that waits on simulated
+    upstream calls (Cloudinary, Gemini) and does a little CPU work per request,
+    so the run needs no database or API keys.
+
+    Usage (from the backend directory):
+        python -m benchmarks.server_profiles --requests 2000 --concurrency 64
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+from fastapi import FastAPI
+
+from run import development_options, production_options
+
+UPSTREAM_SECONDS = float(os.getenv("BENCHMARK_UPSTREAM_SECONDS", "0.05"))
+
+app = FastAPI()
+
+@app.post("/analyze")
+async def analyze():
+    # Building messages, hashing and JSON encoding
+    sum(i * i for i in range(5000))
+    await asyncio.sleep(UPSTREAM_SECONDS)
+    return {"label": "Real", "confidence": 0.9}
+
+def start_server(profile: str, port: int) -> subprocess.Popen:
+    options = development_options() if profile == "development" else production_options()
+    options.update(host="127.0.0.1", port=port)
+
+    code = (
+        "import uvicorn\n"
+        f"uvicorn.run('benchmarks.server_profiles:app', **{options!r})\n"
+    )
+
+    return subprocess.Popen(
+        [sys.executable, "-c", code],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+
+def wait_until_ready(port: int, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+
+    raise RuntimeError(f"Server on port {port} did not start")
+
+async def send_request(port: int) -> tuple:
+    started = time.perf_counter()
+
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"POST /analyze HTTP/1.1\r\nHost: localhost\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+        await writer.drain()
+
+        status_line = await reader.readline()
+        await reader.read()
+        writer.close()
+
+        status = int(status_line.split()[1])
+
+    except (OSError, IndexError, ValueError):
+        status = 0
+
+    return status, time.perf_counter() - started
+
+async def load(port: int, requests: int, concurrency: int) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded():
+        async with semaphore:
+            return await send_request(port)
+
+    return await asyncio.gather(*[bounded() for _ in range(requests)])
+
+def report(profile: str, results: list, elapsed: float):
+    ok = sorted(latency for status, latency in results if status == 200)
+    rejected = sum(1 for status, _ in results if status == 503)
+    failed = len(results) - len(ok) - rejected
+    percentile = lambda p: ok[min(int(len(ok) * p), len(ok) - 1)] * 1000 if ok else float("nan")
+
+    print(
+        f"{profile:<12} ok={len(ok):5d}  503={rejected:5d}  errors={failed:4d}  "
+        f"p50={percentile(0.50):7.1f}ms  p95={percentile(0.95):7.1f}ms  "
+        f"p99={percentile(0.99):7.1f}ms  mean={statistics.mean(ok) * 1000 if ok else float('nan'):7.1f}ms  "
+        f"throughput={len(ok) / elapsed:7.1f} ok/s"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--profiles", nargs="+", default=["development", "production"])
+    args = parser.parse_args()
+
+    print(f"{args.requests} requests, {args.concurrency} concurrent, {UPSTREAM_SECONDS * 1000:.0f}ms upstream wait per request\n")
+
+    for profile in args.profiles:
+        server = start_server(profile, args.port)
+
+        try:
+            wait_until_ready(args.port)
+            # Let reloaders and worker processes finish starting
+            time.sleep(2)
+
+            started = time.perf_counter()
+            results = asyncio.run(load(args.port, args.requests, args.concurrency))
+            report(profile, results, time.perf_counter() - started)
+
+        finally:
+            os.killpg(server.pid, signal.SIGTERM)
+            server.wait()
+
+if __name__ == "__main__":
+    main()
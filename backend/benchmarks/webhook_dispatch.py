@@ -0,0 +1,121 @@
+"""
+    Throughput of the Clerk webhook dispatch layer against the previous handler,
+    which built a svix Webhook (decoding the secret) and verified every delivery.
+
+    Deliveries are signed with a throwaway secret and follow the mix Clerk sends:
+    mostly session.* and user.updated events, a few user.deleted events, some of
+    them delivered twice. The user.deleted handler does no work, so the run
+    needs no database.
+
+    Usage (from the backend directory):
+        python -m benchmarks.webhook_dispatch --events 20000
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import time
+from datetime import datetime, timezone
+
+from fastapi import HTTPException
+from svix.webhooks import Webhook
+
+from app.core.webhooks import WebhookDispatcher
+
+SECRET = "whsec_" + base64.b64encode(os.urandom(24)).decode()
+
+EVENT_MIX = [
+    ("session.created", 0.35),
+    ("session.ended", 0.25),
+    ("user.updated", 0.3),
+    ("user.deleted", 0.1)
+]
+
+def build_event(event_type: str, index: int) -> dict:
+    data = {"id": f"user_{index:08d}", "object": "user"}
+
+    if event_type == "user.updated":
+        # Profile updates carry the whole user object
+        data.update({
+            "email_addresses": [{"email_address": f"user{index}@example.com", "verification": {"status": "verified", "strategy": "email_code"}}],
+            "external_accounts": [{"provider": "oauth_google", "object": "google_account"}],
+            "public_metadata": {},
+            "private_metadata": {},
+            "image_url": "https://img.clerk.com/" + "x" * 200
+        })
+    elif event_type.startswith("session."):
+        data = {"id": f"sess_{index:08d}", "object": "session", "user_id": f"user_{index:08d}", "status": "active"}
+
+    return {"data": data, "object": "event", "timestamp": int(time.time() * 1000), "type": event_type}
+
+def build_deliveries(count: int, duplicate_rate: float) -> list:
+    signer = Webhook(SECRET)
+    types, weights = zip(*EVENT_MIX)
+    deliveries = []
+
+    for index in range(count):
+        if deliveries and random.random() < duplicate_rate:
+            deliveries.append(random.choice(deliveries))
+            continue
+
+        event_type = random.choices(types, weights)[0]
+        payload = json.dumps(build_event(event_type, index)).encode()
+        message_id = f"msg_{index:08d}"
+        timestamp = datetime.now(timezone.utc)
+
+        deliveries.append((payload, {
+            "svix-id": message_id,
+            "svix-timestamp": str(int(timestamp.timestamp())),
+            "svix-signature": signer.sign(message_id, timestamp, payload.decode())
+        }))
+
+    return deliveries
+
+async def legacy_dispatch(payload: bytes, headers: dict) -> dict:
+    webhook = Webhook(SECRET)
+    event = webhook.verify(payload, headers) or json.loads(payload)
+
+    if event["type"] == "user.deleted":
+        pass
+
+    return {"status": "success"}
+
+async def run(dispatch, deliveries: list) -> float:
+    started = time.perf_counter()
+
+    for payload, headers in deliveries:
+        try:
+            await dispatch(payload, headers)
+        except HTTPException:
+            pass
+
+    return time.perf_counter() - started
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--duplicates", type=float, default=0.05, help="Share of deliveries that are retries")
+    args = parser.parse_args()
+
+    deliveries = build_deliveries(args.events, args.duplicates)
+
+    dispatcher = WebhookDispatcher("benchmark", SECRET, replay_max_entries=10000, replay_ttl_seconds=600)
+    handled = []
+
+    @dispatcher.on("user.deleted")
+    async def on_user_deleted(message_id: str, event: dict):
+        handled.append(message_id)
+
+    print(f"{len(deliveries)} deliveries\n")
+
+    for name, dispatch in (("legacy", legacy_dispatch), ("dispatcher", dispatcher.dispatch)):
+        elapsed = await run(dispatch, deliveries)
+        print(f"{name:<11} {len(deliveries) / elapsed:9.0f} events/s  {elapsed / len(deliveries) * 1e6:7.2f}us/event")
+
+    print(f"\nuser.deleted handled {len(handled)} times for {len(set(handled))} distinct messages")
+
+if __name__ == "__main__":
+    asyncio.run(main())
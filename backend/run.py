@@ -1,11 +1,82 @@
+import argparse
+import glob
+import importlib.util
+import os
+import sys
+import tempfile
 import uvicorn
 
+from app.config import Config
+
+def development_options() -> dict:
+    """
+        Single process with auto reload, for local development.
+    """
+
+    return {
+        "host": "0.0.0.0",
+        "port": 5001,
+        "reload": True,
+        "timeout_keep_alive": 180,
+        "limit_concurrency": 3
+    }
+
+def production_options() -> dict:
+    """
+        One worker process per CPU core (or WEB_WORKERS), uvloop and httptools when installed,
+        and a grace period on shutdown for in-flight analyses to finish.
+        The access log is off, request latency is on /metrics instead.
+    """
+
+    return {
+        "host": Config.WEB_HOST,
+        "port": Config.WEB_PORT,
+        "workers": Config.WEB_WORKERS or os.cpu_count() or 1,
+        "loop": "uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+        "http": "httptools" if importlib.util.find_spec("httptools") else "h11",
+        "limit_concurrency": Config.WEB_LIMIT_CONCURRENCY,
+        "backlog": Config.WEB_BACKLOG,
+        "timeout_keep_alive": Config.WEB_KEEP_ALIVE_SECONDS,
+        "timeout_graceful_shutdown": Config.SHUTDOWN_GRACE_SECONDS,
+        "proxy_headers": True,
+        "access_log": False
+    }
+
+def prepare_workers(workers: int):
+    """
+        Settings the worker processes inherit when there are several of them.
+        Prometheus metrics go through files in a shared directory, so /metrics reports
+        every worker and not just the one answering the scrape. Rate limits must live in
+        MongoDB, per worker buckets would multiply every user's budget by the worker count,
+        and so must response cache invalidations, or a worker would serve a chat from before a write.
+    """
+
+    if workers < 2:
+        return
+
+    for name, kept in (("RATE_LIMIT_STORE", "a bucket"), ("RESPONSE_CACHE_STORE", "cache invalidations")):
+        store = os.getenv(name)
+
+        if store and store != "mongo":
+            sys.exit(f"{name}={store} keeps {kept} per worker, set it to mongo or run a single worker (WEB_WORKERS=1).")
+
+        os.environ[name] = "mongo"
+
+    metrics_dir = Config.METRICS_DIR or tempfile.mkdtemp(prefix="aidentify-metrics-")
+    os.makedirs(metrics_dir, exist_ok=True)
+
+    # Files of a previous run would be added to the new counters
+    for path in glob.glob(os.path.join(metrics_dir, "*.db")):
+        os.remove(path)
+
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+
 if __name__ == "__main__":
-    uvicorn.run(
-        "app.main:app", 
-        host="0.0.0.0", 
-        port=5001, 
-        reload=True,
-        timeout_keep_alive=180,
-        limit_concurrency=3
-    )
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Start the AIdentify backend.")
+    parser.add_argument("--production", action="store_true", help="Run the multi-worker production profile")
+    args = parser.parse_args()
+
+    options = production_options() if args.production else development_options()
+    prepare_workers(options.get("workers", 1))
+
+    uvicorn.run("app.main:app", **options)
@@ -0,0 +1,28 @@
+"""
+    Fails when a hot query would scan a whole collection.
+
+    Creates the indexes first (same as app startup), then explains every
+    query in app.core.indexes.HOT_QUERIES against the configured database.
+
+    Usage (from the backend directory):
+        python -m scripts.check_query_plans
+"""
+
+import asyncio
+import sys
+
+from app.core.indexes import ensure_indexes, find_collection_scans
+
+async def main() -> int:
+    await ensure_indexes()
+    scans = await find_collection_scans()
+
+    if scans:
+        print(f"COLLSCAN in {len(scans)} hot queries: {', '.join(scans)}")
+        return 1
+
+    print("All hot queries use an index.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
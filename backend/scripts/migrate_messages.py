@@ -0,0 +1,78 @@
+"""
+    Moves the messages embedded in chat documents to the messages collection.
+
+    Runs online: set MESSAGE_STORE=collection on the app first, so no new messages
+    are pushed into chat documents, then run this while the app serves traffic.
+    Chats are read in batches in _id order. A chat that received a message while
+    it was being copied is retried on the next pass. Safe to interrupt and run again.
+
+    Usage (from the backend directory):
+        python -m scripts.migrate_messages --batch-size 100 --pause 0.5
+"""
+
+import argparse
+import asyncio
+import sys
+
+from app.config import Config
+from app.core.database import db
+from app.core.indexes import ensure_indexes
+from app.crud.chat_messages import migrate_chat
+
+async def migrate_pass(batch_size: int, pause: float) -> tuple:
+    """
+        Migrates every chat that still holds embedded messages once.
+        Returns (migrated chats, chats to retry).
+    """
+
+    migrated = 0
+    retry = 0
+    last_id = None
+
+    while True:
+        query = {"messages": {"$exists": True}}
+
+        if last_id:
+            query["_id"] = {"$gt": last_id}
+
+        chats = await db["chats"].find(query, {"messages": 1, "message_count": 1}).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+
+        if not chats:
+            return migrated, retry
+
+        for chat in chats:
+            if await migrate_chat(chat):
+                migrated += 1
+            else:
+                retry += 1
+
+        last_id = chats[-1]["_id"]
+        print(f"Migrated {migrated} chats, {retry} to retry, up to _id {last_id}")
+
+        # Leave room for the live traffic
+        await asyncio.sleep(pause)
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=Config.MESSAGE_MIGRATION_BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=0.5, help="Seconds to wait between batches")
+    parser.add_argument("--passes", type=int, default=5, help="Passes over the chats changed during a pass")
+    args = parser.parse_args()
+
+    if Config.MESSAGE_STORE != "collection":
+        print("MESSAGE_STORE is not 'collection', chats written meanwhile will be retried or need another run.")
+
+    await ensure_indexes()
+
+    for _ in range(args.passes):
+        migrated, retry = await migrate_pass(args.batch_size, args.pause)
+
+        if not retry:
+            print("All chats migrated.")
+            return 0
+
+    print(f"{retry} chats kept changing, run the migration again.")
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))